@@ -0,0 +1,83 @@
+"""Compare BLIP and Whisper accuracy and latency across MODEL_PRECISION settings.
+
+Runs the same sample images and audio through each precision and reports load
+time, mean inference latency, process RSS and how close each output is to the
+fp32 output, so a deployment can pick a precision for its hardware.
+
+    python benchmark_precision.py --images a.jpg b.png --audio talk.wav
+"""
+import argparse
+import difflib
+import gc
+import os
+import time
+
+import librosa
+from PIL import Image
+
+import main
+
+
+def rss_mb():
+    """Resident set size of this process in MB (Linux only)"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        return float('nan')
+
+def similarity(a, b):
+    """Word level similarity between two outputs, 1.0 means identical"""
+    return difflib.SequenceMatcher(None, a.lower().split(), b.lower().split()).ratio()
+
+def timed(fn, runs):
+    """Run fn `runs` times, returns the last output and the mean latency"""
+    output = None
+    started = time.perf_counter()
+    for _ in range(runs):
+        output = fn()
+    return output, (time.perf_counter() - started) / runs
+
+def benchmark(name, loader, run, samples, precisions, runs):
+    reference = None
+    print(f"\n== {name}")
+    print(f"{'precision':<10}{'load s':>8}{'latency s':>11}{'rss MB':>9}{'vs fp32':>9}")
+    for precision in precisions:
+        gc.collect()
+        started = time.perf_counter()
+        processor, model = loader(precision)
+        load_time = time.perf_counter() - started
+
+        outputs, latency = timed(lambda: run(processor, model, samples), runs)
+        text = " ".join(outputs)
+        if reference is None:
+            reference = text
+
+        print(f"{precision:<10}{load_time:>8.1f}{latency:>11.2f}{rss_mb():>9.0f}{similarity(reference, text):>9.2f}")
+        for output in outputs:
+            print(f"    {output}")
+        del processor, model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', nargs='*', default=[], help="sample images for BLIP")
+    parser.add_argument('--audio', nargs='*', default=[], help="sample audio files for Whisper, first 30s each")
+    parser.add_argument('--precisions', default='fp32,int8,bf16',
+                        help="comma separated precisions, the first one is the reference")
+    parser.add_argument('--runs', type=int, default=3, help="timed runs per precision")
+    args = parser.parse_args()
+
+    precisions = [p.strip() for p in args.precisions.split(',') if p.strip()]
+
+    if args.images:
+        images = [Image.open(path) for path in args.images]
+        benchmark("BLIP", main.load_blip, main.run_blip, images, precisions, args.runs)
+
+    if args.audio:
+        chunks = [librosa.load(path, sr=16000, mono=True, duration=30)[0] for path in args.audio]
+        benchmark("Whisper", main.load_whisper, main.run_whisper, chunks, precisions, args.runs)
+
+    if not args.images and not args.audio:
+        parser.error("pass --images and/or --audio samples")
@@ -1,25 +1,57 @@
 import os
 import time
+import threading
+import contextlib
+import gc
+import argparse
+import queue
+import shutil
+import functools
 
 import pika
-from PIL import Image
-from pdf2image import convert_from_path
+from PIL import Image, ImageOps
+from pdf2image import convert_from_path, pdfinfo_from_path
 import pytesseract
 import torch
 from transformers import BlipProcessor, BlipForConditionalGeneration, WhisperProcessor, WhisperForConditionalGeneration
-import cv2
 import json
 import base64
 from rake_nltk import Rake
 import nltk
 
 import concurrent.futures
-from pydub import AudioSegment
 import librosa
+import subprocess
+import tempfile
+import signal
+import re
+import numpy as np
+import hashlib
+import sqlite3
+import collections
+import collections.abc
+import heapq
+import math
+import importlib.util
 
 import ssl
 from dotenv import load_dotenv
-import chardet
+
+# Optional binary framing and compression support
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+import codecs
+from chardet import UniversalDetector
 
 
 
@@ -42,15 +74,324 @@ QUEUE_NAME = 'file_processing_queue'
 credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
 context = ssl.create_default_context()
 
-print(" [x] Loading models...")
-blip_processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-blip_model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
+# Result publisher settings
+PUBLISH_MAX_RETRIES = int(os.getenv('PUBLISH_MAX_RETRIES', 5))
+PUBLISH_BACKOFF_BASE = float(os.getenv('PUBLISH_BACKOFF_BASE', 0.5))
+PUBLISH_BACKOFF_MAX = float(os.getenv('PUBLISH_BACKOFF_MAX', 30))
+# Heartbeat of the publisher connection, serviced by its keepalive thread between jobs
+PUBLISHER_HEARTBEAT = int(os.getenv('PUBLISHER_HEARTBEAT', 60))
+
+# Consumer concurrency settings, WORKER_COUNT=1 keeps jobs inline on the consumer thread
+WORKER_COUNT = int(os.getenv('WORKER_COUNT', 1))
+WORKER_POOL = os.getenv('WORKER_POOL', 'thread')  # 'thread' or 'process'
+PREFETCH_COUNT = int(os.getenv('PREFETCH_COUNT', WORKER_COUNT))
+
+# 'exclusive' gives each process a private queue, 'shared' makes every replica of
+# this module a competing consumer on one durable queue with acks sent after publishing
+QUEUE_MODE = os.getenv('QUEUE_MODE', 'exclusive')
+SHARED_QUEUE_NAME = os.getenv('SHARED_QUEUE_NAME', '')
+# Manually acked jobs that fail this many deliveries are rejected without requeueing
+# (dead-lettered when the queue has a DLX policy). Quorum queues count deliveries in
+# x-delivery-count, classic queues only flag redeliveries so a job is retried once there
+MAX_DELIVERY_ATTEMPTS = int(os.getenv('MAX_DELIVERY_ATTEMPTS', 3))
+
+# Claim-check transfers: a message may carry 'file_ref', a path relative to the shared
+# backend volume, instead of the whole file base64 encoded in 'filedata'
+SHARED_FS_ROOT = os.getenv('SHARED_FS_ROOT', '/app/backend/fs')
+
+# Message framing, requests are decoded according to their AMQP content_type and
+# content_encoding, results are published as RESULT_CONTENT_TYPE
+JSON_CONTENT_TYPE = 'application/json'
+MSGPACK_CONTENT_TYPES = ('application/msgpack', 'application/x-msgpack')
+RESULT_CONTENT_TYPE = os.getenv('RESULT_CONTENT_TYPE', JSON_CONTENT_TYPE)
+
+# Chunked transfers that receive no chunk for this many seconds are discarded
+CHUNK_TRANSFER_TIMEOUT = int(os.getenv('CHUNK_TRANSFER_TIMEOUT', 600))
+
+# Text encodings are detected from at most this many bytes at the start of a file
+ENCODING_DETECT_BYTES = int(os.getenv('ENCODING_DETECT_BYTES', 64 * 1024))
+
+# BLIP micro-batching: captions from concurrent worker threads are grouped into one
+# generate call of up to BLIP_BATCH_SIZE images, waiting at most BLIP_BATCH_WAIT_MS
+BLIP_BATCH_SIZE = int(os.getenv('BLIP_BATCH_SIZE', 8))
+BLIP_BATCH_WAIT_MS = float(os.getenv('BLIP_BATCH_WAIT_MS', 50))
+
+# Images are decoded straight to BLIP's input size, animated images are captioned
+# from up to IMAGE_MAX_FRAMES evenly spaced frames
+IMAGE_INPUT_SIZE = int(os.getenv('IMAGE_INPUT_SIZE', 384))
+IMAGE_MAX_FRAMES = int(os.getenv('IMAGE_MAX_FRAMES', 4))
+
+# Number of 30 second audio chunks fed to a single Whisper generate call
+WHISPER_BATCH_SIZE = int(os.getenv('WHISPER_BATCH_SIZE', 4))
+
+# Voice activity detection before Whisper: only regions louder than VAD_TOP_DB below
+# the peak (and above VAD_MIN_RMS absolute) are transcribed, silence is skipped
+VAD_ENABLED = os.getenv('VAD_ENABLED', 'true').lower() == 'true'
+VAD_TOP_DB = float(os.getenv('VAD_TOP_DB', 35))
+VAD_MIN_RMS = float(os.getenv('VAD_MIN_RMS', 0.003))
+VAD_MIN_SPEECH = 0.25  # seconds, shorter bursts are treated as noise
+VAD_PADDING = 0.2  # seconds kept around each region so words aren't clipped
+
+# Transcribed chunks are checkpointed here so a redelivered job resumes where it stopped,
+# only with manual acks (QUEUE_MODE=shared or WORKER_COUNT > 1), see checkpoints below
+CHECKPOINT_DIR = os.getenv('CHECKPOINT_DIR', 'checkpoints')
+CHECKPOINT_TTL = int(os.getenv('CHECKPOINT_TTL', 7 * 24 * 3600))
+
+# Results are cached by file content so re-uploaded files skip extraction, the
+# cache is shared by every worker using the same RESULT_CACHE_DIR
+RESULT_CACHE = os.getenv('RESULT_CACHE', 'true').lower() == 'true'
+RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR', 'cache')
+RESULT_CACHE_MAX_MB = float(os.getenv('RESULT_CACHE_MAX_MB', 64))
+# Bump to invalidate cached results after changing how tags are extracted
+RESULT_CACHE_VERSION = os.getenv('RESULT_CACHE_VERSION', '1')
+
+# Optional visual track for videos: keyframes sampled every VIDEO_FRAME_INTERVAL seconds
+# (spread out further on long videos) or at scene changes, at most VIDEO_MAX_FRAMES per
+# video, captioned with BLIP while the audio is being transcribed
+VIDEO_KEYFRAMES = os.getenv('VIDEO_KEYFRAMES', 'false').lower() == 'true'
+VIDEO_KEYFRAME_MODE = os.getenv('VIDEO_KEYFRAME_MODE', 'interval')  # 'interval' or 'scene'
+VIDEO_FRAME_INTERVAL = float(os.getenv('VIDEO_FRAME_INTERVAL', 10))
+VIDEO_MAX_FRAMES = int(os.getenv('VIDEO_MAX_FRAMES', 8))
+VIDEO_SCENE_THRESHOLD = float(os.getenv('VIDEO_SCENE_THRESHOLD', 0.3))
+
+# PDF pages whose embedded text layer has fewer than PDF_MIN_TEXT_CHARS characters,
+# or is mostly non-alphanumeric junk, are rasterized and OCRed instead
+PDF_MIN_TEXT_CHARS = int(os.getenv('PDF_MIN_TEXT_CHARS', 20))
+
+# Pages are rendered PDF_RENDER_BATCH at a time and OCRed from memory, with at most
+# PDF_MAX_IN_FLIGHT rendered pages waiting for or going through OCR
+PDF_RENDER_BATCH = int(os.getenv('PDF_RENDER_BATCH', 4))
+PDF_MAX_IN_FLIGHT = int(os.getenv('PDF_MAX_IN_FLIGHT', 8))
+
+# OCR backend: 'tesserocr' keeps one initialized Tesseract engine per OCR thread,
+# 'pytesseract' runs the tesseract CLI per page, 'auto' prefers tesserocr when installed
+OCR_BACKEND = os.getenv('OCR_BACKEND', 'auto')
+OCR_LANGUAGE = os.getenv('OCR_LANGUAGE', 'eng')
+
+
+def detect_cpu_limit():
+    """CPUs this container may use: the cgroup quota, else the affinity mask, else cpu_count"""
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+
+    quota = period = None
+    try:
+        # cgroup v2, "max 100000" when unlimited
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            limit, period = f.read().split()
+        if limit != 'max':
+            quota = int(limit)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1, -1 when unlimited
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+                quota = int(f.read())
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+                period = f.read()
+        except (OSError, ValueError):
+            pass
+
+    if quota and quota > 0 and period:
+        cpus = min(cpus, math.ceil(quota / int(period)))
+    return max(1, cpus)
+
+# Resource governor: thread pools are sized from the container's CPU budget so that
+# torch, OCR and poppler don't oversubscribe cores when jobs run concurrently. Every
+# value can be pinned through the environment.
+CPU_LIMIT = int(os.getenv('CPU_LIMIT') or detect_cpu_limit())
+JOB_CPUS = max(1, CPU_LIMIT // max(1, WORKER_COUNT))  # share of one concurrent job
+TORCH_THREADS = int(os.getenv('TORCH_THREADS') or JOB_CPUS)
+OCR_WORKERS = int(os.getenv('OCR_WORKERS') or (CPU_LIMIT if WORKER_POOL == 'thread' else JOB_CPUS))
+POPPLER_THREADS = int(os.getenv('POPPLER_THREADS') or min(PDF_RENDER_BATCH, JOB_CPUS))
+# Each OCR worker handles one page, tesseract's own OpenMP threads would only compete
+OMP_THREAD_LIMIT = os.getenv('OMP_THREAD_LIMIT') or '1'
+
+# Set after torch is imported so it only reaches tesseract (CLI or tesserocr), not torch
+os.environ['OMP_THREAD_LIMIT'] = OMP_THREAD_LIMIT
+torch.set_num_threads(TORCH_THREADS)
+print(f" [+] CPU budget {CPU_LIMIT}: torch threads {TORCH_THREADS}, OCR workers {OCR_WORKERS}, "
+      f"poppler threads {POPPLER_THREADS}, OMP_THREAD_LIMIT {OMP_THREAD_LIMIT}")
+
+# Models are loaded on first use and dropped again after MODEL_IDLE_TTL idle seconds (0 keeps them)
+BLIP_MODEL_NAME = "Salesforce/blip-image-captioning-base"
+WHISPER_MODEL_NAME = "openai/whisper-large"
+MODEL_IDLE_TTL = int(os.getenv('MODEL_IDLE_TTL', 900))
+
+# Inference precision for the models: fp32, int8 (dynamic quantization) or bf16
+MODEL_PRECISION = os.getenv('MODEL_PRECISION', 'fp32')
+
+# Whisper tiers and the routing table that picks one per job. Rules are checked in
+# order and the first one whose conditions all hold wins; conditions are
+# 'quality' (the message's quality hint), 'max_duration' (audio seconds, never met
+# when the duration is unknown) and 'min_backlog' (messages waiting in our queue when
+# the job was dispatched). A rule without conditions is the default.
+WHISPER_TIERS = json.loads(os.getenv('WHISPER_TIERS') or json.dumps({
+    'tiny': 'openai/whisper-tiny',
+    'base': 'openai/whisper-base',
+    'small': 'openai/whisper-small',
+    'large': WHISPER_MODEL_NAME
+}))
+WHISPER_ROUTES = json.loads(os.getenv('WHISPER_ROUTES') or json.dumps([
+    {'quality': 'high', 'tier': 'large'},
+    {'quality': 'low', 'tier': 'base'},
+    {'max_duration': 60, 'tier': 'base'},
+    {'min_backlog': 20, 'tier': 'small'},
+    {'tier': 'large'}
+]))
+WHISPER_DEFAULT_TIER = WHISPER_ROUTES[-1]['tier'] if WHISPER_ROUTES else 'large'
+
+
+class ModelRegistry:
+    """Lazily loaded models shared by all jobs in this process.
+
+    Each model is loaded at most once at a time (single-flight per name) and
+    handed out through use(), which tracks active users so the reaper thread
+    only evicts models that nobody is running and that sat idle past the TTL.
+    Preloaded models are pinned and never evicted.
+    """
+
+    def __init__(self, loaders, idle_ttl):
+        self._loaders = loaders
+        self._idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in loaders}
+        self._models = {}
+        self._last_used = {}
+        self._active = {name: 0 for name in loaders}
+        self._pinned = set()
+        self._reaper = None
+
+    @contextlib.contextmanager
+    def use(self, name):
+        """Borrow a loaded model, loading it first if needed"""
+        model = self._acquire(name)
+        try:
+            yield model
+        finally:
+            with self._lock:
+                self._active[name] -= 1
+                self._last_used[name] = time.monotonic()
+
+    def preload(self, names):
+        """Load models up front and keep them loaded, the reaper skips them"""
+        for name in names:
+            with self.use(name):
+                pass
+            with self._lock:
+                self._pinned.add(name)
+
+    def _acquire(self, name):
+        with self._lock:
+            if name in self._models:
+                self._active[name] += 1
+                return self._models[name]
+
+        # Only one thread loads a given model, the others wait for it here
+        with self._load_locks[name]:
+            with self._lock:
+                if name in self._models:
+                    self._active[name] += 1
+                    return self._models[name]
+
+            print(f" [x] Loading {name} model...")
+            started = time.monotonic()
+            model = self._loaders[name]()
+            print(f" [+] Loaded {name} model in {time.monotonic() - started:.1f} seconds")
+
+            with self._lock:
+                self._models[name] = model
+                self._active[name] += 1
+            self._ensure_reaper()
+            return model
+
+    def evict_idle(self):
+        """Drop models that are unused, not preloaded and idle for longer than the TTL"""
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            for name in list(self._models):
+                if name in self._pinned:
+                    continue
+                if self._active[name] == 0 and now - self._last_used.get(name, now) > self._idle_ttl:
+                    del self._models[name]
+                    evicted.append(name)
+        if evicted:
+            gc.collect()
+            print(f" [+] Evicted idle models: {', '.join(evicted)}")
+
+    def _ensure_reaper(self):
+        if self._idle_ttl <= 0:
+            return
+        with self._lock:
+            if self._reaper is not None and self._reaper.is_alive():
+                return
+            self._reaper = threading.Thread(target=self._reap, name='model-reaper', daemon=True)
+            self._reaper.start()
+
+    def _reap(self):
+        while True:
+            time.sleep(min(60, self._idle_ttl))
+            self.evict_idle()
 
-print(" [x] Loading further models...")
-whisper_processor = WhisperProcessor.from_pretrained("openai/whisper-large")
-whisper_model = WhisperForConditionalGeneration.from_pretrained("openai/whisper-large")
 
-print(" [+] Model loading done...")
+def cpu_supports_bf16():
+    """True when the CPU has native bf16 instructions (AVX512-BF16 or AMX)"""
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+def prepare_model(model, precision=None):
+    """Switch a freshly loaded model to inference mode in the requested precision.
+
+    int8 applies dynamic quantization to the linear layers, bf16 casts the
+    weights when the CPU supports it natively, anything else stays fp32.
+    """
+    precision = precision or MODEL_PRECISION
+    model.eval()
+    if precision == 'int8':
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if precision == 'bf16':
+        if cpu_supports_bf16():
+            return model.to(torch.bfloat16)
+        print(" [!] CPU has no native bf16 support, keeping fp32")
+    return model
+
+def load_blip(precision=None):
+    processor = BlipProcessor.from_pretrained(BLIP_MODEL_NAME)
+    model = BlipForConditionalGeneration.from_pretrained(BLIP_MODEL_NAME)
+    return processor, prepare_model(model, precision)
+
+def load_whisper(precision=None, model_name=WHISPER_MODEL_NAME):
+    processor = WhisperProcessor.from_pretrained(model_name)
+    model = WhisperForConditionalGeneration.from_pretrained(model_name)
+    return processor, prepare_model(model, precision)
+
+model_loaders = {'blip': load_blip}
+for tier, model_name in WHISPER_TIERS.items():
+    model_loaders[f'whisper:{tier}'] = functools.partial(load_whisper, model_name=model_name)
+models = ModelRegistry(model_loaders, MODEL_IDLE_TTL)
+
+def select_whisper_tier(duration, quality=None, backlog=0):
+    """Pick a Whisper tier for a job from WHISPER_ROUTES.
+
+    duration is None when it is unknown, duration routes are skipped then.
+    backlog is the queue length snapshotted when the job was dispatched.
+    """
+    for route in WHISPER_ROUTES:
+        if 'quality' in route and route['quality'] != quality:
+            continue
+        if 'max_duration' in route and (duration is None or duration > route['max_duration']):
+            continue
+        if 'min_backlog' in route and backlog < route['min_backlog']:
+            continue
+        if route['tier'] in WHISPER_TIERS:
+            return route['tier']
+    return WHISPER_DEFAULT_TIER
 
 # Supported file extensions
 IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.gif']
@@ -60,62 +401,404 @@ PDF_EXTENSIONS = ['.pdf']
 TEXT_EXTENSIONS = ['.txt']
 
 
-# Process Image (BLIP)
-def process_image(file_path):
-    image = Image.open(file_path)
-    inputs = blip_processor(image, return_tensors="pt")
-    out = blip_model.generate(**inputs)
-    caption = blip_processor.decode(out[0], skip_special_tokens=True)
+class CaptionBatcher:
+    """Inference scheduler in front of BLIP.
+
+    Jobs submit images and block on a future while a single scheduler thread
+    gathers them into batches, closing a batch when it is full or the oldest
+    image waited max_wait seconds, and runs one batched generate for it.
+    Batching only pays off with a thread worker pool, otherwise images are
+    captioned directly on the calling thread.
+    """
+
+    def __init__(self, max_batch_size, max_wait):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.enabled = max_batch_size > 1 and WORKER_COUNT > 1 and WORKER_POOL == 'thread'
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._batches = 0
+        self._images = 0
+
+    def caption(self, image):
+        return self.caption_many([image])[0]
+
+    def caption_many(self, images):
+        """Caption a list of PIL images, returns the captions in the same order"""
+        if not self.enabled:
+            return generate_captions(images)
+
+        self._ensure_started()
+        futures = []
+        for image in images:
+            future = concurrent.futures.Future()
+            self._queue.put((image, future))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def stats(self):
+        """Batch-fill metrics since startup"""
+        with self._lock:
+            batches, images = self._batches, self._images
+        return {
+            'batches': batches,
+            'images': images,
+            'avg_batch_size': images / batches if batches else 0.0,
+            'avg_fill': images / (batches * self.max_batch_size) if batches else 0.0
+        }
 
-    # os.remove(file_path)
-    return caption
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='blip-batcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
 
-def load_audio(file_path):
-    audio, _ = librosa.load(file_path, sr=16000)  # Load with librosa at 16 kHz
-    return audio
+    def _run_batch(self, batch):
+        try:
+            captions = generate_captions([image for image, _ in batch])
+            for (_, future), caption in zip(batch, captions):
+                future.set_result(caption)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
 
-# Process Audio (Whisper)
-def process_audio(file_path, isWav = False):
-    try:
-        if not isWav:
-            # Convert MP3 or WAV to a 16kHz, mono WAV file using pydub
-            audio = AudioSegment.from_file(file_path)
-            audio = audio.set_frame_rate(16000).set_channels(1)
-
-            # Export the processed audio to WAV format
-            wav_path = file_path.replace(".mp3", ".wav").replace(".wav", "_processed.wav")
-            audio.export(wav_path, format="wav")
+        with self._lock:
+            self._batches += 1
+            self._images += len(batch)
+        stats = self.stats()
+        print(f" [+] BLIP batch of {len(batch)}/{self.max_batch_size}, "
+              f"avg fill {stats['avg_fill']:.0%} over {stats['batches']} batches")
+
+
+def generate_captions(images):
+    """Caption a batch of PIL images with a single BLIP generate call"""
+    with models.use('blip') as (blip_processor, blip_model):
+        return run_blip(blip_processor, blip_model, images)
+
+def run_blip(blip_processor, blip_model, images):
+    """Caption PIL images with the given BLIP processor and model"""
+    images = [image if image.mode == 'RGB' else image.convert('RGB') for image in images]
+    inputs = blip_processor(images, return_tensors="pt")
+    inputs['pixel_values'] = inputs['pixel_values'].to(blip_model.dtype)
+    with torch.no_grad():
+        out = blip_model.generate(**inputs)
+    return blip_processor.batch_decode(out, skip_special_tokens=True)
+
+caption_batcher = CaptionBatcher(BLIP_BATCH_SIZE, BLIP_BATCH_WAIT_MS / 1000)
+
+# Process Image (BLIP)
+def load_image(file_path, size=IMAGE_INPUT_SIZE, max_frames=IMAGE_MAX_FRAMES):
+    """Decode an image straight to BLIP's input size, returns a list of RGB frames.
+
+    JPEGs are decoded in draft mode at the smallest DCT scale that still covers
+    the target size and other formats are reduced while resizing, so large
+    photos never get fully decoded. EXIF orientation is applied and the mode is
+    converted once here. Animated images yield up to max_frames evenly spaced frames.
+    """
+    with Image.open(file_path) as image:
+        n_frames = getattr(image, 'n_frames', 1) if getattr(image, 'is_animated', False) else 1
+        if n_frames > 1:
+            step = n_frames / min(n_frames, max_frames)
+            indices = sorted({int(i * step) for i in range(min(n_frames, max_frames))})
         else:
-            wav_path = file_path
+            indices = [0]
+
+        frames = []
+        for index in indices:
+            image.seek(index)
+            if index == 0:
+                image.draft('RGB', (size, size))
+            frame = ImageOps.exif_transpose(image)
+            if frame.mode != 'RGB':
+                if frame.mode in ('RGBA', 'LA', 'PA') or 'transparency' in frame.info:
+                    # Flatten transparency onto white rather than black
+                    rgba = frame.convert('RGBA')
+                    frame = Image.new('RGB', rgba.size, (255, 255, 255))
+                    frame.paste(rgba, mask=rgba.getchannel('A'))
+                else:
+                    frame = frame.convert('RGB')
+            # BlipProcessor resizes to size x size without keeping the aspect ratio, do it here
+            frames.append(frame.resize((size, size), Image.Resampling.BICUBIC, reducing_gap=3.0))
+        return frames
 
-        # Load the entire audio using librosa for chunk processing
-        audio_data, sampling_rate = librosa.load(wav_path, sr=16000, mono=True)
-        print(" [-] Audio data loaded")
+def process_image(file_path):
+    frames = load_image(file_path)
+    if len(frames) == 1:
+        caption = caption_batcher.caption(frames[0])
+    else:
+        # Animated image, caption the sampled frames together
+        caption = ". ".join(dict.fromkeys(caption_batcher.caption_many(frames)))
 
-        # Define chunk duration (e.g., 30 seconds) in samples
-        chunk_duration = 30 * sampling_rate  # 30 seconds per chunk
-        total_duration = len(audio_data) / sampling_rate  # Total duration in seconds
-        print(f" [-] Total audio duration: {total_duration} seconds")
+    # os.remove(file_path)
+    return caption
 
-        # Split the audio into chunks of 30 seconds each
-        audio_chunks = [audio_data[i:i + chunk_duration] for i in range(0, len(audio_data), chunk_duration)]
-        print(f" [-] Audio split into {len(audio_chunks)} chunks for processing")
+def file_sha256(file_path):
+    """SHA-256 of a file's content, read in blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TranscriptCheckpoints:
+    """Per-chunk transcription checkpoints kept in a local SQLite database.
+
+    Entries are keyed by a job key (content hash plus the settings that decide
+    how the audio is chunked) and the chunk index. Every call opens its own
+    connection, so worker threads and processes can share the database.
+    A job's entries are discarded once its result is published, and entries
+    older than the TTL are pruned periodically (see schedule_checkpoint_prune).
+    """
+
+    def __init__(self, directory, ttl):
+        self._directory = directory
+        self._path = os.path.join(directory, 'transcripts.db')
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        with self._lock:
+            if not self._initialized:
+                os.makedirs(self._directory, exist_ok=True)
+                with contextlib.closing(sqlite3.connect(self._path, timeout=30)) as db, db:
+                    db.execute("PRAGMA journal_mode=WAL")
+                    db.execute("""CREATE TABLE IF NOT EXISTS checkpoints (
+                        job_key TEXT NOT NULL,
+                        chunk_index INTEGER NOT NULL,
+                        text TEXT NOT NULL,
+                        updated REAL NOT NULL,
+                        PRIMARY KEY (job_key, chunk_index))""")
+                self._initialized = True
+        return contextlib.closing(sqlite3.connect(self._path, timeout=30))
+
+    def load(self, job_key):
+        """Already transcribed chunks of a job as {chunk index: text}"""
+        with self._connect() as db:
+            rows = db.execute("SELECT chunk_index, text FROM checkpoints WHERE job_key = ?", (job_key,))
+            return dict(rows.fetchall())
+
+    def save(self, job_key, chunk_index, text):
+        with self._connect() as db, db:
+            db.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?)",
+                       (job_key, chunk_index, text, time.time()))
+
+    def discard(self, digest):
+        """Drop every checkpoint of a file, whatever tier or settings it was transcribed with"""
+        with self._connect() as db, db:
+            db.execute("DELETE FROM checkpoints WHERE job_key LIKE ?", (f"{digest}:%",))
+
+    def prune(self):
+        """Drop checkpoints older than the TTL, left behind by jobs that never finished"""
+        with self._connect() as db, db:
+            pruned = db.execute("DELETE FROM checkpoints WHERE updated < ?", (time.time() - self._ttl,)).rowcount
+        if pruned:
+            print(f" [-] Pruned {pruned} stale transcription checkpoints")
+
+
+# Inline exclusive mode auto-acks every delivery on arrival, an interrupted job is
+# never redelivered there, so checkpoints are only kept when jobs are acked manually
+checkpoints = (TranscriptCheckpoints(CHECKPOINT_DIR, CHECKPOINT_TTL)
+               if QUEUE_MODE == 'shared' or WORKER_COUNT > 1 else None)
+
+def ffmpeg_binary():
+    """ffmpeg from PATH, or the one bundled with imageio-ffmpeg"""
+    binary = os.getenv('FFMPEG_BINARY') or shutil.which('ffmpeg')
+    if binary:
+        return binary
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+def ffmpeg_audio_command(file_path, sampling_rate=16000):
+    """ffmpeg command decoding the first audio stream of any media file to raw mono float32"""
+    return [
+        ffmpeg_binary(), '-nostdin', '-v', 'error',
+        '-i', file_path,
+        '-vn', '-ac', '1', '-ar', str(sampling_rate),
+        '-f', 'f32le', '-'
+    ]
+
+def transcribe_batch(chunks, tier=None):
+    """Transcribe a list of audio chunks with a single Whisper generate call"""
+    with models.use(f'whisper:{tier or WHISPER_DEFAULT_TIER}') as (whisper_processor, whisper_model):
+        return run_whisper(whisper_processor, whisper_model, chunks)
+
+def run_whisper(whisper_processor, whisper_model, chunks):
+    """Transcribe 16 kHz audio chunks with the given Whisper processor and model"""
+    audio_input = whisper_processor(chunks, return_tensors="pt", sampling_rate=16000)
+    input_features = audio_input['input_features'].to(whisper_model.dtype)
+    with torch.no_grad():
+        predicted_ids = whisper_model.generate(input_features, task="transcribe")
+    return whisper_processor.batch_decode(predicted_ids, skip_special_tokens=True)
+
+def transcribe_chunks(chunks, batch_size=None, tier=None):
+    """Yield the transcription of each chunk in order, WHISPER_BATCH_SIZE chunks at a time"""
+    batch_size = max(1, batch_size or WHISPER_BATCH_SIZE)
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) == batch_size:
+            yield from transcribe_batch(batch, tier)
+            batch = []
+    if batch:
+        yield from transcribe_batch(batch, tier)
+
+def find_speech_regions(audio_data, sampling_rate):
+    """Energy based voice activity detection, returns merged (start, end) sample ranges"""
+    if len(audio_data) == 0:
+        return []
 
-        transcription = ""
+    padding = int(VAD_PADDING * sampling_rate)
+    min_length = int(VAD_MIN_SPEECH * sampling_rate)
+    regions = []
+    for start, end in librosa.effects.split(audio_data, top_db=VAD_TOP_DB):
+        if end - start < min_length:
+            continue
+        if np.sqrt(np.mean(np.square(audio_data[start:end]))) < VAD_MIN_RMS:
+            continue
 
-        # Process each chunk
-        for idx, chunk in enumerate(audio_chunks):
-            # Prepare the chunk for Whisper input
-            audio_input = whisper_processor(chunk, return_tensors="pt", sampling_rate=16000)
+        start = max(0, start - padding)
+        end = min(len(audio_data), end + padding)
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], max(end, regions[-1][1]))
+        else:
+            regions.append((start, end))
+    return regions
+
+def iter_speech_segments(blocks, sampling_rate, stats):
+    """Yield the speech parts of each audio block, counting audio and speech seconds in stats"""
+    for block in blocks:
+        stats['audio'] += len(block) / sampling_rate
+        for start, end in find_speech_regions(block, sampling_rate):
+            stats['speech'] += (end - start) / sampling_rate
+            yield block[start:end]
+
+def pack_speech_windows(segments, window):
+    """Pack speech segments into windows of at most `window` samples, as they arrive.
+
+    A segment that doesn't fit in the current window starts a new one, only
+    segments longer than a whole window are split.
+    """
+    current = []
+    current_length = 0
+    for segment in segments:
+        if current and current_length + len(segment) > window:
+            yield np.concatenate(current)
+            current, current_length = [], 0
+        while len(segment) > window:
+            yield segment[:window]
+            segment = segment[window:]
+        current.append(segment)
+        current_length += len(segment)
+    if current:
+        yield np.concatenate(current)
+
+def stream_audio_blocks(file_path, block_seconds=30, sampling_rate=16000):
+    """Decode media with ffmpeg incrementally, yielding float32 blocks of block_seconds.
+
+    Only one block is held at a time, so memory stays flat however long the file is.
+    """
+    block_bytes = block_seconds * sampling_rate * 4  # float32 samples
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(ffmpeg_audio_command(file_path, sampling_rate),
+                                   stdout=subprocess.PIPE, stderr=stderr)
+        try:
+            while True:
+                data = process.stdout.read(block_bytes)
+                if not data:
+                    break
+                yield np.frombuffer(data[:len(data) - len(data) % 4], dtype=np.float32)
+        finally:
+            process.stdout.close()
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+
+        if process.returncode not in (0, -signal.SIGKILL):
+            stderr.seek(0)
+            raise RuntimeError(f"ffmpeg failed to decode {file_path}: {stderr.read().decode(errors='replace').strip()}")
+
+def probe_duration(file_path):
+    """Media duration in seconds from the container header, None when unknown"""
+    result = subprocess.run([ffmpeg_binary(), '-nostdin', '-hide_banner', '-i', file_path],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=False)
+    match = re.search(rb'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', result.stderr)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
 
-            # Transcribe the chunk
-            with torch.no_grad():
-                predicted_ids = whisper_model.generate(audio_input['input_features'], task="transcribe")
+# Process Audio (Whisper)
+def process_audio(file_path, quality=None, digest=None, backlog=0):
+    try:
+        sampling_rate = 16000
+        chunk_duration = 30 * sampling_rate  # 30 seconds per chunk
 
-            # Decode the transcription
-            chunk_transcription = whisper_processor.decode(predicted_ids[0], skip_special_tokens=True)
-            transcription += chunk_transcription + " "
-            print(f" [-] Processed chunk {idx + 1}/{len(audio_chunks)}")
+        # Duration from the header only, the audio itself is decoded as it is transcribed
+        total_duration = probe_duration(file_path)
+        if total_duration is None:
+            print(" [-] Total audio duration unknown")
+        else:
+            print(f" [-] Total audio duration: {total_duration} seconds")
+
+        # Decode straight to 16kHz mono float32 in 30 second blocks, no intermediate WAV files
+        blocks = stream_audio_blocks(file_path, 30, sampling_rate)
+        stats = {'audio': 0.0, 'speech': 0.0}
+        if VAD_ENABLED:
+            # Only transcribe speech, packed into windows of up to 30 seconds
+            audio_chunks = pack_speech_windows(iter_speech_segments(blocks, sampling_rate, stats), chunk_duration)
+        else:
+            audio_chunks = blocks
+
+        tier = select_whisper_tier(total_duration, quality, backlog)
+        print(f" [-] Using Whisper tier '{tier}' (quality: {quality}, backlog: {backlog})")
+
+        # Resume from checkpoints of an earlier, interrupted run of the same file, the key
+        # covers every setting that moves chunk boundaries
+        vad_settings = f"{VAD_TOP_DB},{VAD_MIN_RMS},{VAD_MIN_SPEECH},{VAD_PADDING}" if VAD_ENABLED else "off"
+        job_key = f"{digest or file_sha256(file_path)}:{tier}:{vad_settings}"
+        chunk_texts = checkpoints.load(job_key) if checkpoints else {}
+        if chunk_texts:
+            print(f" [-] Resuming transcription, {len(chunk_texts)} chunks already done")
+
+        pending_indices = collections.deque()
+
+        def pending_chunks():
+            for idx, chunk in enumerate(audio_chunks):
+                if idx not in chunk_texts:
+                    pending_indices.append(idx)
+                    yield chunk
+
+        # Chunks are produced, batched and transcribed as the file is decoded
+        for chunk_transcription in transcribe_chunks(pending_chunks(), tier=tier):
+            idx = pending_indices.popleft()
+            if checkpoints:
+                checkpoints.save(job_key, idx, chunk_transcription)
+            chunk_texts[idx] = chunk_transcription
+            print(f" [-] Processed chunk {idx + 1}")
+
+        transcription = "".join(chunk_texts[idx] + " " for idx in sorted(chunk_texts))
+
+        if VAD_ENABLED:
+            print(f" [-] Speech found in {stats['speech']:.1f} of {stats['audio']:.1f} seconds")
+            if stats['speech'] == 0:
+                print(" [-] No speech detected, skipped transcription")
 
         print(" [-] Complete transcription done")
         print(transcription)
@@ -126,112 +809,308 @@ def process_audio(file_path, isWav = False):
         return None
 
 
-# Process Video (convert to audio, then use Whisper)
-def process_video(file_path):
-    # Create a temporary audio file path
-    audio_file_path = "temp_audio.wav"
-    
-    # Use cv2 to extract audio from video
-    cap = cv2.VideoCapture(file_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    duration = frame_count / fps
-    
-    # Get audio properties
-    audio = AudioSegment.from_file(file_path)
-    audio.export(audio_file_path, format="wav")
-    
-    # Release the video capture
-    cap.release()
-    
-    transcription = process_audio(audio_file_path, isWav=True)
-    
-    # Clean up temporary file
-    try:
-        os.remove(audio_file_path)
-    except:
-        pass
-        
-    print(transcription)
-    return transcription
-
+def sample_keyframes(file_path, duration, mode, size=384):
+    """Grab up to VIDEO_MAX_FRAMES frames as size x size RGB images in one ffmpeg pass.
 
-def pdf_to_images(pdf_path, output_folder='uploads'):
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
+    Frames are scaled to BLIP's input size by ffmpeg, so full resolution frames
+    never reach Python.
+    """
+    if mode == 'scene':
+        input_args = []
+        frame_filter = f"select='gt(scene,{VIDEO_SCENE_THRESHOLD})'"
+    else:
+        # Stretch the interval on long videos so the capped frames cover the whole file
+        interval = max(VIDEO_FRAME_INTERVAL, duration / VIDEO_MAX_FRAMES if duration else 0)
+        input_args = ['-skip_frame', 'nokey']  # only decode keyframes
+        frame_filter = f"fps=1/{interval:.3f}"
+
+    command = [
+        ffmpeg_binary(), '-nostdin', '-v', 'error',
+        *input_args, '-i', file_path,
+        # -vsync rather than -fps_mode, which only exists since ffmpeg 5.1
+        '-an', '-vf', f"{frame_filter},scale={size}:{size}", '-vsync', 'vfr',
+        '-frames:v', str(VIDEO_MAX_FRAMES),
+        '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-'
+    ]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to sample frames: {result.stderr.decode(errors='replace').strip()}")
+
+    frame_bytes = size * size * 3
+    return [
+        Image.frombytes('RGB', (size, size), result.stdout[offset:offset + frame_bytes])
+        for offset in range(0, len(result.stdout) - frame_bytes + 1, frame_bytes)
+    ]
+
+def caption_keyframes(file_path):
+    """Caption sampled keyframes of a video with BLIP, returns unique captions in order"""
+    try:
+        duration = probe_duration(file_path)
+        frames = sample_keyframes(file_path, duration, VIDEO_KEYFRAME_MODE)
+        if not frames and VIDEO_KEYFRAME_MODE == 'scene':
+            # No scene changes (e.g. a static shot), fall back to fixed intervals
+            frames = sample_keyframes(file_path, duration, 'interval')
+        print(f" [-] Sampled {len(frames)} keyframes")
+        if not frames:
+            return []
+        captions = list(dict.fromkeys(caption_batcher.caption_many(frames)))
+        print(f" [-] Keyframe captions: {captions}")
+        return captions
+    except Exception as e:
+        print(f" [!] Error captioning video frames, continuing without captions: {str(e)}")
+        return []
 
-    images = convert_from_path(pdf_path, thread_count=8)
+# Process Video (decode its audio track, then use Whisper)
+def process_video(file_path, quality=None, digest=None, backlog=0):
+    if not VIDEO_KEYFRAMES:
+        transcription = process_audio(file_path, quality=quality, digest=digest, backlog=backlog)
+        print(transcription)
+        return transcription
 
-    image_paths = []
-    for i, image in enumerate(images):
-        # Save each image in the output folder
-        image_path = os.path.join(output_folder, f"page_{i + 1}.png")
-        image.save(image_path, 'PNG')
-        image_paths.append(image_path)
+    if TORCH_THREADS * 2 > JOB_CPUS:
+        # BLIP and Whisper would each run TORCH_THREADS intra-op threads on the same
+        # cores, so within this job's CPU share they run one after the other
+        transcription = process_audio(file_path, quality=quality, digest=digest, backlog=backlog)
+        captions = caption_keyframes(file_path)
+    else:
+        # Enough CPUs for both models, caption keyframes in parallel with the transcription
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            captions_future = executor.submit(caption_keyframes, file_path)
+            transcription = process_audio(file_path, quality=quality, digest=digest, backlog=backlog)
+            captions = captions_future.result()
 
-    return image_paths
+    print(transcription)
+    return ". ".join(part for part in [transcription] + captions if part)
 
 
-def extract_text_from_image(image_path):
-    image = Image.open(image_path)
-    text = pytesseract.image_to_string(image)
+def page_ranges(pages):
+    """Group sorted page numbers into (first, last) runs of consecutive pages"""
+    ranges = []
+    for page in pages:
+        if ranges and page == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], page)
+        else:
+            ranges.append((page, page))
+    return ranges
+
+def iter_pdf_pages(pdf_path, pages):
+    """Render the given 1-based pages in small ranges, yielding (page, PIL image) in order.
+
+    At most PDF_RENDER_BATCH rendered pages exist per range, nothing is written to disk.
+    """
+    for first_page, last_page in page_ranges(pages):
+        for start in range(first_page, last_page + 1, PDF_RENDER_BATCH):
+            end = min(start + PDF_RENDER_BATCH - 1, last_page)
+            images = convert_from_path(pdf_path, thread_count=min(POPPLER_THREADS, end - start + 1),
+                                       first_page=start, last_page=end)
+            for page, image in zip(range(start, end + 1), images):
+                yield page, image
+            del images
+
+
+ocr_local = threading.local()
+ocr_executor = None
+ocr_executor_lock = threading.Lock()
+
+def resolve_ocr_backend():
+    """Pick the OCR backend once at startup, tesserocr is only found here, not imported"""
+    if OCR_BACKEND == 'pytesseract':
+        return 'pytesseract'
+    if importlib.util.find_spec('tesserocr') is None:
+        if OCR_BACKEND == 'tesserocr':
+            print(" [!] OCR_BACKEND=tesserocr but tesserocr is not installed, using pytesseract")
+        return 'pytesseract'
+    return 'tesserocr'
+
+ocr_backend = resolve_ocr_backend()
+print(f" [+] OCR backend: {ocr_backend}")
+
+def tesserocr_engine():
+    """This thread's Tesseract handle, language data is loaded only on first use"""
+    api = getattr(ocr_local, 'api', None)
+    if api is None:
+        # Imported lazily so OMP_THREAD_LIMIT is already set when libtesseract loads
+        import tesserocr
+        api = tesserocr.PyTessBaseAPI(lang=OCR_LANGUAGE)
+        ocr_local.api = api
+    return api
+
+def get_ocr_executor():
+    """OCR thread pool shared by all jobs, so per-thread engines outlive a single PDF"""
+    global ocr_executor
+    with ocr_executor_lock:
+        if ocr_executor is None:
+            ocr_executor = concurrent.futures.ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix='ocr')
+        return ocr_executor
+
+def extract_text_from_image(image):
+    if isinstance(image, str):
+        image = Image.open(image)
+
+    if ocr_backend == 'tesserocr':
+        api = tesserocr_engine()
+        api.SetImage(image)
+        text = api.GetUTF8Text()
+    else:
+        text = pytesseract.image_to_string(image, lang=OCR_LANGUAGE)
 
     return text
 
 
-def process_pdf(file_path, output_folder='uploads'):
-    extracted_text = ""
-    images = pdf_to_images(file_path)
-
-    def process_image(image_path):
-        print(f"Processing {image_path}...")
-        return extract_text_from_image(image_path)
-
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        text_results = executor.map(process_image, images)
+def ocr_pdf_pages(pdf_path, pages):
+    """OCR the given pages, returns {page: text} with bounded rendered pages in flight"""
+    texts = {}
+    in_flight = collections.deque()
+    executor = get_ocr_executor()
+    for page, image in iter_pdf_pages(pdf_path, pages):
+        print(f"Processing page {page}...")
+        in_flight.append((page, executor.submit(extract_text_from_image, image)))
+        del image
+        # Wait for the oldest page before rendering more, keeps memory bounded
+        while len(in_flight) >= PDF_MAX_IN_FLIGHT:
+            done_page, future = in_flight.popleft()
+            texts[done_page] = future.result()
+    while in_flight:
+        done_page, future = in_flight.popleft()
+        texts[done_page] = future.result()
+    return texts
+
+
+def extract_pdf_text_layer(pdf_path, page_count):
+    """Embedded text of every page using poppler's pdftotext, one string per page"""
+    result = subprocess.run(['pdftotext', '-q', '-enc', 'UTF-8', pdf_path, '-'],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(f"pdftotext failed: {result.stderr.decode(errors='replace').strip()}")
+
+    # pdftotext ends every page with a form feed
+    pages = result.stdout.decode('utf-8', errors='replace').split('\f')[:page_count]
+    return pages + [''] * (page_count - len(pages))
+
+def is_usable_text(text):
+    """True when a page's text layer looks like real text rather than empty or junk output"""
+    characters = [c for c in text if not c.isspace()]
+    if len(characters) < PDF_MIN_TEXT_CHARS:
+        return False
+    alphanumeric = sum(c.isalnum() for c in characters)
+    replacement = characters.count('\ufffd')
+    return alphanumeric / len(characters) >= 0.5 and replacement / len(characters) < 0.1
 
-    for text in text_results:
-        extracted_text += text + "\n"
 
-    for i, image in enumerate(images):
-        image_path = os.path.join(output_folder, f"page_{i + 1}.png")
-        print(f"Removing {image_path}...")
-        os.remove(image_path)
-
-    return extracted_text
+def process_pdf(file_path, output_folder='uploads'):
+    page_count = pdfinfo_from_path(file_path)['Pages']
+    try:
+        page_texts = extract_pdf_text_layer(file_path, page_count)
+    except Exception as e:
+        print(f" [!] Could not read the PDF text layer, OCRing every page: {str(e)}")
+        page_texts = [''] * page_count
+
+    # Only rasterize and OCR the pages without a usable text layer
+    ocr_pages = [page for page in range(1, page_count + 1) if not is_usable_text(page_texts[page - 1])]
+    print(f" [+] {page_count - len(ocr_pages)}/{page_count} pages have a text layer, OCRing {len(ocr_pages)}")
+
+    if ocr_pages:
+        for page, text in ocr_pdf_pages(file_path, ocr_pages).items():
+            page_texts[page - 1] = text
+
+    return "".join(text + "\n" for text in page_texts)
+
+# Keyword extraction consumes text in windows of this many characters, only distinct
+# candidate phrases and their counts are kept between windows
+KEYWORD_WINDOW_CHARS = int(os.getenv('KEYWORD_WINDOW_CHARS', 64 * 1024))
+
+# Built once per process, holds the stopword set and tokenizers
+rake = Rake()
+
+class StreamingRake:
+    """RAKE over a stream of text windows.
+
+    Uses the shared Rake's tokenizers, stopwords and phrase splitting, but
+    instead of the whole document and its full phrase list it only keeps a
+    count per distinct candidate phrase. The last, possibly incomplete,
+    sentence of a window is carried over to the next one, so the ranking is
+    the same as Rake.get_ranked_phrases() on the concatenated text.
+    """
+
+    def __init__(self, rake, window_chars=KEYWORD_WINDOW_CHARS):
+        self._rake = rake
+        self._window_chars = window_chars
+        self._carry = ''
+        self.phrases = collections.Counter()
+
+    def feed(self, text):
+        text = self._carry + text
+        sentences = self._rake.sentence_tokenizer(text)
+        if len(sentences) > 1 or len(text) < 2 * self._window_chars:
+            # Hold back the last sentence, the next window may continue it
+            last = sentences.pop() if sentences else ''
+            self._carry = text[text.rfind(last):] if last else ''
+        else:
+            # A single sentence that keeps growing, process it up to its last whitespace
+            # to bound memory without splitting a word, and carry the rest
+            cut = max(text.rfind(c) for c in ' \t\r\n')
+            if cut <= 0:
+                cut = len(text)
+            sentences = [text[:cut]]
+            self._carry = text[cut:]
+        self._add_sentences(sentences)
+
+    def ranked_phrases(self, top_results):
+        """Top ranked phrases, repeated phrases appear once per occurrence like in rake_nltk"""
+        if self._carry:
+            self._add_sentences(self._rake.sentence_tokenizer(self._carry))
+            self._carry = ''
+        return self._rank(top_results)
+
+    def _rank(self, top_results):
+        # Word frequency and degree follow from the phrase counts: every occurrence
+        # of a word co-occurs with each word of its phrase, itself included
+        frequency = collections.Counter()
+        degree = collections.Counter()
+        for phrase, count in self.phrases.items():
+            for word in phrase:
+                frequency[word] += count
+                degree[word] += count * len(phrase)
+
+        scored = ((sum(degree[word] / frequency[word] for word in phrase), ' '.join(phrase), count)
+                  for phrase, count in self.phrases.items())
+        ranked = []
+        for _, phrase, count in heapq.nlargest(top_results, scored):
+            ranked.extend([phrase] * count)
+        return ranked[:top_results]
+
+    def _add_sentences(self, sentences):
+        for sentence in sentences:
+            words = [word.lower() for word in self._rake.word_tokenizer(sentence)]
+            self.phrases.update(self._rake._get_phrase_list_from_words(words))
+
+def iter_text_windows(text, size=KEYWORD_WINDOW_CHARS):
+    """Split a string into windows of `size` characters"""
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
 
 def extract_tags(content, top_results=5):
-    """Extract key phrases from text content using RAKE"""
-    r = Rake()
-
-    # Force convert content to string
-    if not isinstance(content, str):
-        content = str(content)
+    """Extract key phrases from text content using RAKE.
 
-    # Check if content is None or empty
-    if not content or content.strip() == "" or content == "None":
-        return []
-    
-    r.extract_keywords_from_text(content)
-    ranked_tags = r.get_ranked_phrases()
-    return ranked_tags[:top_results]
+    `content` is a string or an iterator of text windows, e.g. from iter_text_file().
+    """
+    if isinstance(content, collections.abc.Iterator):
+        windows = content
+    else:
+        # Force convert content to string
+        if not isinstance(content, str):
+            content = str(content)
 
+        # Check if content is None or empty
+        if not content or content.strip() == "" or content == "None":
+            return []
+        windows = iter_text_windows(content)
 
-def process_text_file(file_path):
-    """Process text file and extract metadata"""
-    try:
-        # Load text content
-        content = load_text_file(file_path)
-        if not content:
-            return None
+    engine = StreamingRake(rake)
+    for window in windows:
+        engine.feed(window)
+    return engine.ranked_phrases(top_results)
 
-        # Extract tags from content
-        tags = extract_tags(content)
-
-        return tags
-    except Exception as e:
-        print(f"Error processing text file: {str(e)}")
-        return None
 
 def save_temp_file(file_name, file_data):
     temp_file_path = os.path.join("uploads", file_name)
@@ -240,87 +1119,207 @@ def save_temp_file(file_name, file_data):
         temp_file.write(decoded_file_data)
     return temp_file_path
 
-def load_text_file(file_path):
-    print(f" [+] Loading text file")
+def detect_encoding(file_path, limit=ENCODING_DETECT_BYTES):
+    """Guess a file's encoding from at most `limit` bytes of its start"""
     with open(file_path, 'rb') as f:
-        raw = f.read()
+        prefix = f.read(limit)
 
-        if not raw:
-            print(" [!] File is empty.")
-            return ""
-        
-        result = chardet.detect(raw)
-        encoding = result['encoding']
-        print(f" [+] Detected encoding: {encoding}")
-        try:
-            return raw.decode(encoding)
-        except Exception as e:
-            print(f"Error decoding file with detected encoding {encoding}: {str(e)}")
-            return None
+    # UTF-32 BOMs begin with the UTF-16 ones, so they are checked first
+    for bom, encoding in ((codecs.BOM_UTF8, 'utf-8-sig'),
+                          (codecs.BOM_UTF32_LE, 'utf-32'), (codecs.BOM_UTF32_BE, 'utf-32'),
+                          (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16')):
+        if prefix.startswith(bom):
+            return encoding
+
+    # Fast path for UTF-8 (and ASCII), a character cut off at the end of the prefix is fine
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(prefix, final=len(prefix) < limit)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+
+    detector = UniversalDetector()
+    for start in range(0, len(prefix), 4096):
+        detector.feed(prefix[start:start + 4096])
+        if detector.done:
+            break
+    detector.close()
+    return detector.result['encoding'] or 'utf-8'
+
+def iter_text_file(file_path, size=KEYWORD_WINDOW_CHARS):
+    """Stream a text file as decoded windows of `size` characters"""
+    encoding = detect_encoding(file_path)
+    print(f" [+] Streaming text file, detected encoding: {encoding}")
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        # chardet can name codecs Python does not have, e.g. 'x-euc-tw'
+        print(f" [!] Python has no codec for {encoding}, decoding as utf-8")
+        encoding = 'utf-8'
+    # newline='' keeps line endings as they are in the file
+    with open(file_path, encoding=encoding, errors='replace', newline='') as f:
+        for window in iter(lambda: f.read(size), ''):
+            yield window
 
 def dedupe_tags(tags):
     return list(set(tags))
 
-def send_message_to_queue(queue_name, message):
-    try:
-        # Establish a new connection to RabbitMQ
-        connection = pika.BlockingConnection(pika.ConnectionParameters(
+class ResultPublisher:
+    """Long-lived RabbitMQ publisher shared by every job in this process.
+
+    Keeps one connection and channel open, declares each target queue only
+    once and reconnects with exponential backoff when the broker goes away.
+    The channel uses publisher confirms, so a publish only succeeds once the
+    broker has taken the message. Publishing is serialized with a lock so
+    worker threads can share it, and a keepalive thread services heartbeats
+    under the same lock so the connection survives idle gaps between jobs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connection = None
+        self._channel = None
+        self._declared_queues = set()
+        self._keepalive_thread = None
+
+    def _connect(self):
+        self._connection = pika.BlockingConnection(pika.ConnectionParameters(
             host=RABBITMQ_HOST,
             credentials=credentials,
             virtual_host=RABBITMQ_VHOST,
-            port=RABBITMQ_PORT  # Standard AMQP port
+            port=RABBITMQ_PORT,
+            heartbeat=PUBLISHER_HEARTBEAT,
+            blocked_connection_timeout=300
         ))
-        channel = connection.channel()
-
-        channel.queue_declare(queue=queue_name, durable=True)
-
-        # JSON encode the message before sending
-        message_json = json.dumps(message)
-
-        channel.basic_publish(
-            exchange='',
-            routing_key=queue_name,
-            body=message_json,
-            properties=pika.BasicProperties(delivery_mode=2)
-        )
-        print(f" [*] Message sent to queue '{queue_name}'")
-    except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError) as e:
-        print(f" [!] Connection or channel error: {str(e)}, retrying in 5 seconds...")
-        time.sleep(5)
-
-        # retry
+        self._channel = self._connection.channel()
+        self._channel.confirm_delivery()
+        self._declared_queues = set()
+        print(" [*] Publisher connection opened")
+
+        # Heartbeats are disabled with 0, there is nothing to keep alive then.
+        # Not alive in a forked worker process, the thread is started again there
+        if PUBLISHER_HEARTBEAT > 0 and (self._keepalive_thread is None or not self._keepalive_thread.is_alive()):
+            self._keepalive_thread = threading.Thread(target=self._keepalive, name='publisher-keepalive', daemon=True)
+            self._keepalive_thread.start()
+
+    def _keepalive(self):
+        while True:
+            time.sleep(PUBLISHER_HEARTBEAT / 3)
+            with self._lock:
+                if self._connection is None or not self._connection.is_open:
+                    continue
+                try:
+                    self._connection.process_data_events(time_limit=0)
+                except pika.exceptions.AMQPError as e:
+                    print(f" [!] Publisher connection lost while idle: {e!r}")
+                    self._reset()
+
+    def _ensure_channel(self):
+        if (self._connection is None or self._connection.is_closed
+                or self._channel is None or self._channel.is_closed):
+            self._reset()
+            self._connect()
+
+    def _reset(self):
         try:
-            connection = pika.BlockingConnection(pika.ConnectionParameters(
-                host=RABBITMQ_HOST,
-                credentials=credentials,
-                virtual_host=RABBITMQ_VHOST,
-                port=RABBITMQ_PORT  # Standard AMQP port
-            ))
-            channel = connection.channel()
-
-            channel.queue_declare(queue=queue_name, durable=True)
-
-            # JSON encode the message before sending (in retry as well)
-            message_json = json.dumps(message)
-
-            channel.basic_publish(
-                exchange='',
-                routing_key=queue_name,
-                body=message_json,
-                properties=pika.BasicProperties(delivery_mode=2)
-            )
-            print(f" [*] Message resent after reconnection to queue '{queue_name}'")
-
-        except Exception as retry_error:
-            print(f" [!] Failed to republish message after reconnecting: {str(retry_error)}")
+            if self._connection is not None and self._connection.is_open:
+                self._connection.close()
+        except Exception:
+            pass
+        self._connection = None
+        self._channel = None
+        self._declared_queues = set()
+
+    def publish(self, queue_name, body, properties=None):
+        """Publish body to a durable queue, returns True once the broker confirmed it"""
+        if properties is None:
+            properties = pika.BasicProperties(delivery_mode=2)
+
+        with self._lock:
+            for attempt in range(PUBLISH_MAX_RETRIES + 1):
+                if attempt > 1:
+                    # The first retry is immediate, a stale idle connection is the usual cause
+                    delay = min(PUBLISH_BACKOFF_MAX, PUBLISH_BACKOFF_BASE * (2 ** (attempt - 2)))
+                    print(f" [!] Retrying publish in {delay:.1f} seconds...")
+                    time.sleep(delay)
+                try:
+                    self._ensure_channel()
+                    if queue_name not in self._declared_queues:
+                        self._channel.queue_declare(queue=queue_name, durable=True)
+                        self._declared_queues.add(queue_name)
+
+                    # Blocks until the broker acks, raises NackError/UnroutableError otherwise
+                    self._channel.basic_publish(
+                        exchange='',
+                        routing_key=queue_name,
+                        body=body,
+                        properties=properties,
+                        mandatory=True
+                    )
+                    return True
+                except pika.exceptions.AMQPError as e:
+                    print(f" [!] Publish attempt {attempt + 1} failed: {e!r}")
+                    self._reset()
+
+            print(f" [!] Giving up on publishing to '{queue_name}' after {PUBLISH_MAX_RETRIES + 1} attempts")
+            return False
+
+    def close(self):
+        with self._lock:
+            self._reset()
+            print(" [*] Publisher connection closed")
+
+
+publisher = ResultPublisher()
+
+def supported_framing():
+    """Content types and encodings this process can decode, sent on registration"""
+    content_types = [JSON_CONTENT_TYPE]
+    if msgpack is not None:
+        content_types += list(MSGPACK_CONTENT_TYPES)
+    content_encodings = ['identity']
+    if zstandard is not None:
+        content_encodings.append('zstd')
+    if lz4 is not None:
+        content_encodings.append('lz4')
+    return content_types, content_encodings
+
+def decode_message(body, content_type=None, content_encoding=None):
+    """Decode a message body from JSON or msgpack, decompressing it first if needed"""
+    if content_encoding == 'zstd' and zstandard is not None:
+        # Streaming decompressor, the frame header may not carry the content size
+        body = zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    elif content_encoding == 'lz4' and lz4 is not None:
+        body = lz4.frame.decompress(body)
+    elif content_encoding not in (None, '', 'identity'):
+        raise ValueError(f"unsupported content encoding: {content_encoding}")
+
+    if content_type in MSGPACK_CONTENT_TYPES:
+        if msgpack is None:
+            raise ValueError("msgpack message received but msgpack is not installed")
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body)
+
+def encode_message(message):
+    """Encode an outgoing message as RESULT_CONTENT_TYPE, returns body and properties"""
+    if RESULT_CONTENT_TYPE in MSGPACK_CONTENT_TYPES and msgpack is not None:
+        body = msgpack.packb(message, use_bin_type=True)
+        content_type = RESULT_CONTENT_TYPE
+    else:
+        body = json.dumps(message)
+        content_type = JSON_CONTENT_TYPE
+    return body, pika.BasicProperties(delivery_mode=2, content_type=content_type)
 
+def send_message_to_queue(queue_name, message):
+    """Send message to RabbitMQ queue"""
+    try:
+        message_body, properties = encode_message(message)
+        if publisher.publish(queue_name, message_body, properties):
+            print(f" [*] Message sent to queue '{queue_name}'")
+            return True
     except Exception as e:
         print(f"Failed to publish message: {str(e)}")
-
-    finally:
-        if 'connection' in locals() and connection.is_open:
-            connection.close()
-            print(" [*] Connection closed after sending the message.")
+    return False
 
 def decide_dynamic_type(content):
     # YouTube detection
@@ -632,7 +1631,10 @@ def register_module(module_id):
             return
             
         if not availability['is_available']:
-            if availability['suggested_id']:
+            if QUEUE_MODE == 'shared':
+                # Another replica registered this ID already, join it on the shared queue
+                print(f" [+] Module ID {module_id} already registered, joining as a shared replica")
+            elif availability['suggested_id']:
                 print(f" [+] Using suggested module ID: {availability['suggested_id']}")
                 module_id = availability['suggested_id']
             else:
@@ -658,9 +1660,12 @@ def register_module(module_id):
         )
         
         # Register this module with its supported extensions
+        content_types, content_encodings = supported_framing()
         registration_message = {
             'module_id': module_id,
-            'supported_extensions': IMAGE_EXTENSIONS + AUDIO_EXTENSIONS + VIDEO_EXTENSIONS + PDF_EXTENSIONS + TEXT_EXTENSIONS
+            'supported_extensions': IMAGE_EXTENSIONS + AUDIO_EXTENSIONS + VIDEO_EXTENSIONS + PDF_EXTENSIONS + TEXT_EXTENSIONS,
+            'content_types': content_types,
+            'content_encodings': content_encodings
         }
         
         channel.basic_publish(
@@ -676,77 +1681,226 @@ def register_module(module_id):
         print(f" [-] Failed to register module: {str(e)}")
         return None
 
+def link_shared_file(file_ref, local_file_path):
+    """Expose a file from the shared volume at local_file_path without copying it"""
+    root = os.path.realpath(SHARED_FS_ROOT)
+    shared_path = os.path.realpath(os.path.join(root, file_ref))
+
+    # Refuse references that escape the shared volume
+    if os.path.commonpath([root, shared_path]) != root:
+        raise ValueError(f"file reference outside of {SHARED_FS_ROOT}: {file_ref}")
+    if not os.path.isfile(shared_path):
+        raise FileNotFoundError(f"shared file not found: {shared_path}")
+
+    if os.path.lexists(local_file_path):
+        os.remove(local_file_path)
+    try:
+        os.symlink(shared_path, local_file_path)
+    except OSError:
+        # Symlinks not permitted here (e.g. Windows without privileges), fall back to a copy
+        shutil.copyfile(shared_path, local_file_path)
+
+def callback(ch, method, properties, body, queue_name):
+    """Callback function for RabbitMQ messages, runs jobs inline with auto-ack (exclusive mode)"""
+    if is_transfer_message(properties):
+        completed = receive_transfer_message(properties, body)
+        done = process_request(*completed, read_queue_backlog(ch, queue_name)) if completed else True
+    else:
+        done = process_message(body, properties.content_type, properties.content_encoding,
+                               read_queue_backlog(ch, queue_name))
+    if not done:
+        # The delivery was auto-acked on arrival, so the broker has nothing to requeue
+        print(" [-] Message was auto-acked, the job is dropped instead of requeued")
+
 # Modify the callback function to handle new message format
-def callback(ch, method, properties, body):
+def process_message(body, content_type=None, content_encoding=None, backlog=0):
+    """Decode an extraction request message and process it"""
     try:
-        data = json.loads(body)
-        file_path = data.get('filename')
+        data = decode_message(body, content_type, content_encoding)
+    except Exception as e:
+        print(f" [-] Error decoding message: {str(e)}")
+        return True
+    return process_request(data, backlog=backlog)
+
+class ResultCache:
+    """Extracted tags cached by file content in a local SQLite database.
+
+    Keys are the SHA-256 of the file plus a version string naming the module,
+    its models and the request options that shape the tags, so a change to any
+    of them misses. Every call opens its own connection and each read or write
+    is a single transaction, so worker threads and processes can share the
+    database. Once the stored tags exceed max_bytes the least recently used
+    entries are evicted. Hit and miss counters live in the database as well.
+    """
+
+    def __init__(self, directory, max_bytes, version):
+        self._directory = directory
+        self._path = os.path.join(directory, 'results.db')
+        self._max_bytes = max_bytes
+        self._version = version
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        with self._lock:
+            if not self._initialized:
+                os.makedirs(self._directory, exist_ok=True)
+                with contextlib.closing(sqlite3.connect(self._path, timeout=30)) as db, db:
+                    db.execute("PRAGMA journal_mode=WAL")
+                    db.execute("""CREATE TABLE IF NOT EXISTS results (
+                        cache_key TEXT PRIMARY KEY,
+                        tags TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        last_used REAL NOT NULL)""")
+                    db.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+                    db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+                    db.execute("INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0)")
+                self._initialized = True
+        return contextlib.closing(sqlite3.connect(self._path, timeout=30))
+
+    def key(self, digest, *options):
+        """Cache key of a file from its content hash, the cache version and request options"""
+        return ":".join([digest, self._version, *options])
+
+    def get(self, cache_key):
+        """Cached tags for a key or None, counts the lookup as a hit or a miss"""
+        with self._connect() as db, db:
+            row = db.execute("SELECT tags FROM results WHERE cache_key = ?", (cache_key,)).fetchone()
+            if row:
+                db.execute("UPDATE results SET last_used = ? WHERE cache_key = ?", (time.time(), cache_key))
+            db.execute("UPDATE counters SET value = value + 1 WHERE name = ?", ('hits' if row else 'misses',))
+            counters = dict(db.execute("SELECT name, value FROM counters"))
+        print(f" [+] Result cache {'hit' if row else 'miss'} ({counters['hits']} hits, {counters['misses']} misses)")
+        return json.loads(row[0]) if row else None
+
+    def put(self, cache_key, tags):
+        encoded = json.dumps(tags)
+        with self._connect() as db, db:
+            db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                       (cache_key, encoded, len(encoded), time.time()))
+            # Keep the most recently used entries that fit in max_bytes
+            db.execute("""DELETE FROM results WHERE cache_key IN (
+                SELECT cache_key FROM (
+                    SELECT cache_key, SUM(size) OVER (ORDER BY last_used DESC, cache_key) AS total
+                    FROM results)
+                WHERE total > ?)""", (self._max_bytes,))
+
+    def stats(self):
+        """Hit and miss counters, entry count and stored bytes"""
+        with self._connect() as db:
+            stats = dict(db.execute("SELECT name, value FROM counters"))
+            stats['entries'], stats['bytes'] = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return stats
+
+
+# Cache key version, covers the module and the models and settings that produce its tags
+RESULT_CACHE_SETTINGS = [
+    RESULT_CACHE_VERSION, BLIP_MODEL_NAME, json.dumps(WHISPER_TIERS, sort_keys=True), MODEL_PRECISION,
+    IMAGE_INPUT_SIZE, IMAGE_MAX_FRAMES,
+    VAD_ENABLED, VAD_TOP_DB, VAD_MIN_RMS, VAD_MIN_SPEECH, VAD_PADDING,
+    VIDEO_KEYFRAMES, VIDEO_KEYFRAME_MODE, VIDEO_FRAME_INTERVAL, VIDEO_MAX_FRAMES, VIDEO_SCENE_THRESHOLD,
+    PDF_MIN_TEXT_CHARS, OCR_LANGUAGE
+]
+result_cache = ResultCache(RESULT_CACHE_DIR, int(RESULT_CACHE_MAX_MB * 1024 * 1024),
+                           "meta_generator:" + ":".join(map(str, RESULT_CACHE_SETTINGS))) if RESULT_CACHE else None
+
+def process_request(data, local_file_path=None, backlog=0):
+    """Process a single extraction request and publish its tags.
+
+    local_file_path is set when the file was already staged, e.g. by a chunked
+    transfer. backlog is the queue length when the message was dispatched, it
+    steers the Whisper tier (see WHISPER_ROUTES). Returns False when the result could not be published and the
+    message should be redelivered, True once it is done with (including bad input).
+    """
+    try:
+        file_ref = data.get('file_ref')  # path on the shared volume, preferred over filedata
+        file_path = data.get('filename') or file_ref
         file_name = os.path.basename(file_path)
-        file_data = data.get('filedata')  # base64 encoded
+        file_data = data.get('filedata')  # base64 encoded, or raw bytes in msgpack
         status_id = data.get('status_id')
         is_dynamic = data.get('is_dynamic', False)
+        quality = data.get('quality')  # optional hint for picking the Whisper tier
 
         print(f" [+] Received message for resource ID: {status_id}")
         
-        if not all([file_name, file_data, status_id]):
+        if not all([file_name, local_file_path or file_ref or file_data, status_id]):
             print(" [-] Invalid message format")
-            return
+            return True
             
-        # Create uploads directory if it doesn't exist
-        if not os.path.exists('uploads'):
-            os.makedirs('uploads')
+        if local_file_path is None:
+            # Create uploads directory if it doesn't exist
+            if not os.path.exists('uploads'):
+                os.makedirs('uploads')
             
-        # Save the file to our uploads directory
-        local_file_path = os.path.join('uploads', file_name)
-        try:
-            decoded_data = base64.b64decode(file_data)
-            with open(local_file_path, 'wb') as f:
-                f.write(decoded_data)
-            print(f" [+] Saved file to: {local_file_path}")
-        except Exception as e:
-            print(f" [!] Failed to save file: {str(e)}")
-            return
+            # Save the file to our uploads directory
+            local_file_path = os.path.join('uploads', f"{status_id}_{file_name}")
+            try:
+                if file_ref:
+                    link_shared_file(file_ref, local_file_path)
+                    print(f" [+] Linked shared file {file_ref} to: {local_file_path}")
+                else:
+                    if isinstance(file_data, bytes):
+                        decoded_data = file_data
+                    else:
+                        decoded_data = base64.b64decode(file_data)
+                    with open(local_file_path, 'wb') as f:
+                        f.write(decoded_data)
+                    print(f" [+] Saved file to: {local_file_path}")
+            except Exception as e:
+                print(f" [!] Failed to save file: {str(e)}")
+                return True
             
         # Process based on file extension
         file_ext = os.path.splitext(local_file_path)[1].lower()
         print(f" [+] File extension: {file_ext}")
         
-        if file_ext in IMAGE_EXTENSIONS:
-            print(f" [+] Processing image")
-            result = process_image(local_file_path)
-        elif file_ext in AUDIO_EXTENSIONS:
-            print(f" [+] Processing audio")
-            result = process_audio(local_file_path)
-        elif file_ext in VIDEO_EXTENSIONS:
-            print(f" [+] Processing video")
-            result = process_video(local_file_path)
-        elif file_ext in PDF_EXTENSIONS:
-            if is_dynamic:
-                print(f" [+] Processing dynamic")
-                result = process_dynamic(local_file_path)
-            else:
-                print(f" [+] Processing pdf")
-                result = process_pdf(local_file_path)
-        elif file_ext in TEXT_EXTENSIONS:
-            print(f" [+] Processing text")
-            result = process_text(local_file_path)
-        else:
+        if file_ext not in IMAGE_EXTENSIONS + AUDIO_EXTENSIONS + VIDEO_EXTENSIONS + PDF_EXTENSIONS + TEXT_EXTENSIONS:
             print(f" [-] Unsupported file type: {file_ext}")
             try:
                 os.remove(local_file_path)
                 print(f" [+] Cleaned up unsupported file: {local_file_path}")
             except Exception as e:
                 print(f" [-] Error cleaning up unsupported file: {str(e)}")
-            return
-            
-        # Extract tags from result
-        tags = extract_tags(result, 5)
-        deduped_tags = dedupe_tags(tags)
+            return True
+
+        # Hashed once, for the result cache and the transcription checkpoints
+        digest = file_sha256(local_file_path)
+
+        # Identical files processed before with the same options are answered from the cache
+        cache_key = (result_cache.key(digest, file_ext, str(quality or ''), 'dynamic' if is_dynamic else '')
+                     if result_cache else None)
+        deduped_tags = result_cache.get(cache_key) if result_cache else None
+        if deduped_tags is None:
+            if file_ext in IMAGE_EXTENSIONS:
+                print(f" [+] Processing image")
+                result = process_image(local_file_path)
+            elif file_ext in AUDIO_EXTENSIONS:
+                print(f" [+] Processing audio")
+                result = process_audio(local_file_path, quality=quality, digest=digest, backlog=backlog)
+            elif file_ext in VIDEO_EXTENSIONS:
+                print(f" [+] Processing video")
+                result = process_video(local_file_path, quality=quality, digest=digest, backlog=backlog)
+            elif file_ext in PDF_EXTENSIONS:
+                if is_dynamic:
+                    print(f" [+] Processing dynamic")
+                    result = process_dynamic(local_file_path)
+                else:
+                    print(f" [+] Processing pdf")
+                    result = process_pdf(local_file_path)
+            elif file_ext in TEXT_EXTENSIONS:
+                print(f" [+] Processing text")
+                result = iter_text_file(local_file_path)
+
+            # Extract tags from result
+            tags = extract_tags(result, 5)
+            deduped_tags = dedupe_tags(tags)
+            if result_cache and deduped_tags:
+                result_cache.put(cache_key, deduped_tags)
 
         print(f" [+] Extracted tags: {deduped_tags} for resource ID: {status_id}")
         
         # Send results back through RabbitMQ using the expected format
-        send_message_to_queue("meta_tags_results", {
+        published = send_message_to_queue("meta_tags_results", {
             'tags': deduped_tags,  # This matches the FileData field in TagsPayload
             'processed_resource_id': int(status_id)  # Convert to int to match Go's type
         })
@@ -758,13 +1912,278 @@ def callback(ch, method, properties, body):
         except Exception as e:
             print(f" [-] Error cleaning up processed file: {str(e)}")
         
+        if not published:
+            print(f" [-] Could not publish tags for resource ID: {status_id}")
+            return False
+
+        # Published, a redelivery can no longer need the transcription checkpoints
+        if checkpoints and file_ext in AUDIO_EXTENSIONS + VIDEO_EXTENSIONS:
+            checkpoints.discard(digest)
+
         print(f" [+] Successfully processed file and sent tags for resource ID: {status_id}")
+        return True
         
     except Exception as e:
         print(f" [-] Error processing message: {str(e)}")
+        return True
+
+class ChunkedTransfers:
+    """Reassembles large files sent as a header message plus sequenced chunks.
+
+    Transfer messages are marked with an 'x-transfer' AMQP header:
+      header: {'status_id', 'filename', 'total_chunks', 'chunk_size', ...request fields}
+      chunk:  {'status_id', 'index', 'data'}
+    Every chunk but the last holds exactly chunk_size bytes and is written at
+    its offset in the file in uploads/ as it arrives, so neither the file nor
+    out-of-order chunks are held in memory. Transfer state lives in this
+    process and the exclusive queue goes away with it, so a crashed consumer
+    loses its transfers and senders retry them. Chunked transfers are rejected
+    when QUEUE_MODE is 'shared', as chunks would spread across replicas; use
+    claim-check references there. Only used from the consumer thread.
+    """
+
+    def __init__(self):
+        self._transfers = {}
+
+    def start(self, header):
+        status_id = str(header['status_id'])
+        file_name = os.path.basename(header['filename'])
+        self._discard(status_id)
+
+        if not os.path.exists('uploads'):
+            os.makedirs('uploads')
+        path = os.path.join('uploads', f"{status_id}_{file_name}")
+
+        self._transfers[status_id] = {
+            'header': header,
+            'path': path,
+            'file': open(path, 'wb'),
+            'total_chunks': int(header['total_chunks']),
+            'chunk_size': int(header['chunk_size']),
+            'received': set(),
+            'updated': time.monotonic()
+        }
+        print(f" [+] Started chunked transfer for resource ID: {status_id} ({header['total_chunks']} chunks)")
+
+    def add_chunk(self, chunk):
+        """Write a chunk, returns the header and file path once the last chunk landed"""
+        status_id = str(chunk['status_id'])
+        transfer = self._transfers.get(status_id)
+        if transfer is None:
+            print(f" [-] Chunk for unknown transfer {status_id}, ignoring")
+            return None
+
+        index = int(chunk['index'])
+        if not 0 <= index < transfer['total_chunks']:
+            print(f" [-] Chunk {index} out of range for transfer {status_id}, ignoring")
+            return None
+        if index in transfer['received']:
+            print(f" [-] Duplicate chunk {index} for transfer {status_id}, ignoring")
+            return None
+
+        data = chunk['data']
+        transfer['file'].seek(index * transfer['chunk_size'])
+        transfer['file'].write(data if isinstance(data, bytes) else base64.b64decode(data))
+        transfer['received'].add(index)
+        transfer['updated'] = time.monotonic()
+
+        if len(transfer['received']) < transfer['total_chunks']:
+            return None
+
+        transfer['file'].close()
+        del self._transfers[status_id]
+        print(f" [+] Completed chunked transfer for resource ID: {status_id}")
+        return transfer['header'], transfer['path']
+
+    def collect_garbage(self):
+        """Drop transfers that have not received a chunk within CHUNK_TRANSFER_TIMEOUT"""
+        now = time.monotonic()
+        for status_id, transfer in list(self._transfers.items()):
+            if now - transfer['updated'] > CHUNK_TRANSFER_TIMEOUT:
+                print(f" [-] Chunked transfer {status_id} timed out after "
+                      f"{len(transfer['received'])}/{transfer['total_chunks']} chunks, discarding")
+                self._discard(status_id)
+
+    def _discard(self, status_id):
+        transfer = self._transfers.pop(status_id, None)
+        if transfer is None:
+            return
+        transfer['file'].close()
+        try:
+            os.remove(transfer['path'])
+        except OSError:
+            pass
+
+
+transfers = ChunkedTransfers()
+
+def is_transfer_message(properties):
+    return bool((properties.headers or {}).get('x-transfer'))
+
+def receive_transfer_message(properties, body):
+    """Handle a chunked transfer message, returns (request, file path) once complete"""
+    try:
+        data = decode_message(body, properties.content_type, properties.content_encoding)
+        kind = properties.headers.get('x-transfer')
+        if QUEUE_MODE == 'shared':
+            # Chunks of one transfer would be spread over every replica of the shared queue
+            print(f" [-] Chunked transfers are not supported with QUEUE_MODE=shared, "
+                  f"dropping {kind} for resource ID: {data.get('status_id')}")
+        elif kind == 'header':
+            transfers.collect_garbage()
+            transfers.start(data)
+        elif kind == 'chunk':
+            return transfers.add_chunk(data)
+        else:
+            print(f" [-] Unknown transfer message type: {kind}")
+    except Exception as e:
+        print(f" [-] Error handling transfer message: {str(e)}")
+    return None
+
+def read_queue_backlog(channel, queue_name):
+    """Messages waiting in our queue right now, read on the consumer thread when a job is dispatched"""
+    try:
+        return channel.queue_declare(queue=queue_name, passive=True).method.message_count
+    except Exception as e:
+        print(f" [-] Could not read queue backlog: {str(e)}")
+        return 0
+
+def schedule_transfer_gc(connection):
+    """Periodically discard stalled chunked transfers on the consumer thread"""
+    interval = min(60, CHUNK_TRANSFER_TIMEOUT)
+
+    def run():
+        transfers.collect_garbage()
+        if connection.is_open:
+            connection.call_later(interval, run)
+
+    connection.call_later(interval, run)
+
+def schedule_checkpoint_prune(connection):
+    """Prune stale transcription checkpoints now and then every hour"""
+    def run():
+        try:
+            checkpoints.prune()
+        except Exception as e:
+            print(f" [-] Could not prune checkpoints: {str(e)}")
+        if connection.is_open:
+            connection.call_later(3600, run)
+
+    connection.call_later(0, run)
+
+def create_worker_pool():
+    """Create the executor jobs are handed to, or None to run them inline"""
+    if WORKER_COUNT <= 1:
+        if QUEUE_MODE != 'shared':
+            return None
+        # Shared mode acks after the job, which must not block the I/O thread and its heartbeats
+        print(" [+] Using a single worker thread for shared queue mode")
+        return concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    print(f" [+] Using {WORKER_POOL} pool with {WORKER_COUNT} workers, prefetch {PREFETCH_COUNT}")
+    if WORKER_POOL == 'process':
+        return concurrent.futures.ProcessPoolExecutor(max_workers=WORKER_COUNT)
+    return concurrent.futures.ThreadPoolExecutor(max_workers=WORKER_COUNT)
+
+def settle_message(ch, delivery_tag, done, requeue=True):
+    """Ack a finished delivery, requeue or reject it, must run on the connection's own thread"""
+    if not ch.is_open:
+        print(" [-] Channel closed before ack, message will be redelivered")
+    elif done:
+        ch.basic_ack(delivery_tag)
+    elif requeue:
+        print(" [-] Requeueing message")
+        ch.basic_nack(delivery_tag, requeue=True)
+    else:
+        ch.basic_nack(delivery_tag, requeue=False)
+
+def is_last_attempt(method, properties):
+    """True when a failed delivery must not be requeued again (see MAX_DELIVERY_ATTEMPTS)"""
+    headers = properties.headers or {}
+    earlier = headers.get('x-delivery-count')
+    if earlier is None and headers.get('x-death'):
+        # Retried through a dead letter exchange, every pass is counted there
+        earlier = sum(death.get('count', 0) for death in headers['x-death'])
+    if earlier is not None:
+        return int(earlier) + 1 >= MAX_DELIVERY_ATTEMPTS
+    return MAX_DELIVERY_ATTEMPTS <= 1 or method.redelivered
+
+def message_resource_id(properties, body):
+    """The status_id of a request message for logging, None when it can't be decoded"""
+    try:
+        return decode_message(body, properties.content_type, properties.content_encoding).get('status_id')
+    except Exception:
+        return None
+
+class WorkerPool:
+    """The executor jobs are handed to, replaced when one of its processes dies.
+
+    A worker process killed mid-job (OOM, a crash in native code) leaves a
+    ProcessPoolExecutor broken for good, so submitting to a broken pool builds
+    a new one. Only used from the consumer thread.
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+
+    def submit(self, fn, *args):
+        """Submit a job, returns None when the pool was broken and had to be rebuilt"""
+        try:
+            return self.executor.submit(fn, *args)
+        except concurrent.futures.BrokenExecutor:
+            print(" [!] A worker process died, rebuilding the worker pool")
+            self.executor.shutdown(wait=False)
+            self.executor = create_worker_pool()
+            return None
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+def dispatch_message(ch, method, properties, body, connection, pool, queue_name):
+    """Hand a delivery to the worker pool and ack it from the I/O thread once done"""
+    delivery_tag = method.delivery_tag
+    completed = None
+
+    def on_done(future):
+        if future.exception():
+            print(f" [-] Worker failed: {future.exception()}")
+            done = False
+        else:
+            done = future.result()
+        requeue = True
+        if not done and is_last_attempt(method, properties):
+            requeue = False
+            resource_id = completed[0].get('status_id') if completed else message_resource_id(properties, body)
+            print(f" [!] Giving up on resource ID: {resource_id} after its last delivery attempt, rejecting the message")
+        try:
+            connection.add_callback_threadsafe(functools.partial(settle_message, ch, delivery_tag, done, requeue))
+        except Exception as e:
+            print(f" [-] Could not schedule ack, message will be redelivered: {str(e)}")
+
+    if is_transfer_message(properties):
+        # Chunks are written on this thread so they stay in this process
+        completed = receive_transfer_message(properties, body)
+        if completed is None:
+            settle_message(ch, delivery_tag, True)
+            return
+        # The backlog is read here and passed along, worker processes can't see the queue
+        future = pool.submit(process_request, *completed, read_queue_backlog(ch, queue_name))
+    else:
+        future = pool.submit(
+            process_message, body, properties.content_type, properties.content_encoding,
+            read_queue_backlog(ch, queue_name)
+        )
+    if future is None:
+        # Requeued, the redelivery goes to the rebuilt pool
+        settle_message(ch, delivery_tag, False)
+        return
+    future.add_done_callback(on_done)
 
 # Modify the start_rabbitmq_consumer function
 def start_rabbitmq_consumer():
+    executor = create_worker_pool()
+    pool = WorkerPool(executor) if executor is not None else None
+
     while True:  # Main reconnection loop
         try:
             credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
@@ -788,8 +2207,13 @@ def start_rabbitmq_consumer():
             )
             
             # Create a queue for this module
-            result = channel.queue_declare(queue='', exclusive=True)
-            queue_name = result.method.queue
+            if QUEUE_MODE == 'shared':
+                # One durable queue for all replicas, unacked jobs survive a crashed worker
+                queue_name = SHARED_QUEUE_NAME or f'extract.{MODULE_ID}'
+                channel.queue_declare(queue=queue_name, durable=True)
+            else:
+                result = channel.queue_declare(queue='', exclusive=True)
+                queue_name = result.method.queue
             
             # Bind to the appropriate routing key
             channel.queue_bind(
@@ -798,15 +2222,31 @@ def start_rabbitmq_consumer():
                 routing_key=f'extract.{MODULE_ID}'
             )
             
-            # Set QoS to handle messages one at a time
-            channel.basic_qos(prefetch_count=1)
-            
-            channel.basic_consume(
-                queue=queue_name,
-                on_message_callback=callback,
-                auto_ack=True
-            )
+            if pool is None:
+                # Set QoS to handle messages one at a time
+                channel.basic_qos(prefetch_count=1)
+
+                channel.basic_consume(
+                    queue=queue_name,
+                    on_message_callback=functools.partial(callback, queue_name=queue_name),
+                    auto_ack=True
+                )
+            else:
+                # Keep up to PREFETCH_COUNT deliveries in flight, acked once their worker finishes
+                channel.basic_qos(prefetch_count=PREFETCH_COUNT)
+
+                channel.basic_consume(
+                    queue=queue_name,
+                    on_message_callback=functools.partial(
+                        dispatch_message, connection=connection, pool=pool, queue_name=queue_name
+                    ),
+                    auto_ack=False
+                )
             
+            schedule_transfer_gc(connection)
+            if checkpoints:
+                schedule_checkpoint_prune(connection)
+
             print(f" [*] Waiting for extraction requests...")
             
             try:
@@ -814,6 +2254,9 @@ def start_rabbitmq_consumer():
             except KeyboardInterrupt:
                 channel.stop_consuming()
                 connection.close()
+                publisher.close()
+                if pool is not None:
+                    pool.shutdown()
                 break
             except pika.exceptions.ConnectionClosedByBroker:
                 print(" [-] Connection was closed by broker, retrying...")
@@ -838,6 +2281,21 @@ def start_rabbitmq_consumer():
             continue
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OmniVaultX universal meta extractor")
+    parser.add_argument('--preload', default=os.getenv('MODEL_PRELOAD', ''),
+                        help="comma separated models to load at startup (blip, whisper, whisper:<tier> or all)")
+    args = parser.parse_args()
+
+    preload = [name.strip() for name in args.preload.split(',') if name.strip()]
+    if 'all' in preload:
+        preload = ['blip', 'whisper']
+    preload = [f'whisper:{WHISPER_DEFAULT_TIER}' if name == 'whisper' else name for name in preload]
+    unknown = [name for name in preload if name not in model_loaders]
+    if unknown:
+        parser.error(f"unknown model(s) to preload: {', '.join(unknown)}")
+    if preload:
+        models.preload(preload)
+
     # Define module ID
     MODULE_ID = 'meta_generator_1'
     
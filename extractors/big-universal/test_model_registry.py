@@ -0,0 +1,37 @@
+"""Eviction tests for ModelRegistry, run with: python -m unittest test_model_registry"""
+import time
+import unittest
+from unittest import mock
+
+from main import ModelRegistry
+
+
+class ModelRegistryEvictionTest(unittest.TestCase):
+    def setUp(self):
+        # Loaders return plain objects, no real model is loaded. Reaper passes are
+        # run by hand with the clock moved past the TTL.
+        self.registry = ModelRegistry({'blip': object, 'whisper:small': object}, idle_ttl=60)
+
+    def reaper_pass_after(self, seconds):
+        later = time.monotonic() + seconds
+        with mock.patch('time.monotonic', return_value=later):
+            self.registry.evict_idle()
+
+    def test_preloaded_model_survives_reaper_pass(self):
+        self.registry.preload(['blip'])
+        with self.registry.use('whisper:small'):
+            pass
+
+        self.reaper_pass_after(3600)
+
+        self.assertIn('blip', self.registry._models)
+        self.assertNotIn('whisper:small', self.registry._models)
+
+    def test_model_in_use_survives_reaper_pass(self):
+        with self.registry.use('whisper:small'):
+            self.reaper_pass_after(3600)
+            self.assertIn('whisper:small', self.registry._models)
+
+
+if __name__ == '__main__':
+    unittest.main()
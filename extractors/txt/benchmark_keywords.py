@@ -0,0 +1,95 @@
+"""Check and benchmark StreamingRake against rake_nltk.
+
+First checks that StreamingRake returns exactly the ranked phrases of
+rake_nltk's Rake for every paragraph of the corpus and for the corpus as a
+whole, exiting with status 1 on any mismatch. Then builds short, medium and
+very large inputs from the corpus and reports the mean latency of both. The
+corpus defaults to the keyword_corpus.txt next to this script.
+
+    python benchmark_keywords.py
+    python benchmark_keywords.py --corpus notes.txt transcript.txt --large-mb 20
+"""
+import argparse
+import os
+import sys
+import time
+
+from rake_nltk import Rake
+
+import main
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'keyword_corpus.txt')
+
+
+def timed(fn, runs):
+    """Run fn `runs` times, returns the last output and the mean latency"""
+    output = None
+    started = time.perf_counter()
+    for _ in range(runs):
+        output = fn()
+    return output, (time.perf_counter() - started) / runs
+
+def reference_tags(text, top_results):
+    r = Rake()
+    r.extract_keywords_from_text(text)
+    return r.get_ranked_phrases()[:top_results]
+
+def streaming_tags(text, top_results, window_chars=main.KEYWORD_WINDOW_CHARS):
+    engine = main.StreamingRake(main.rake)
+    for window in main.iter_text_windows(text, window_chars):
+        engine.feed(window)
+    return engine.ranked_phrases(top_results)
+
+def check(corpus, top_results):
+    """Compare StreamingRake with rake_nltk, returns the number of mismatches"""
+    documents = [doc for doc in corpus.split("\n\n") if doc.strip()] + [corpus]
+    mismatches = 0
+    # Small windows as well, so carrying sentences between windows is exercised
+    for window_chars in (main.KEYWORD_WINDOW_CHARS, 256):
+        for document in documents:
+            expected = reference_tags(document, top_results)
+            tags = streaming_tags(document, top_results, window_chars)
+            if tags != expected:
+                mismatches += 1
+                print(f" [!] Window {window_chars} differs on: {document[:60]!r}")
+                print(f"    rake_nltk: {expected}")
+                print(f"    streaming: {tags}")
+    print(f"Checked {len(documents)} documents against rake_nltk: {mismatches} mismatches")
+    return mismatches
+
+def build_inputs(corpus, large_mb):
+    """Short, medium and large texts, the corpus is repeated as needed"""
+    sizes = [('short', 500), ('medium', 50 * 1024), ('large', large_mb * 1024 * 1024)]
+    inputs = []
+    for name, size in sizes:
+        text = corpus * (size // len(corpus) + 1)
+        inputs.append((name, text[:size]))
+    return inputs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', nargs='+', default=[DEFAULT_CORPUS], help="text files the inputs are built from")
+    parser.add_argument('--large-mb', type=int, default=20, help="size of the very large input in MB")
+    parser.add_argument('--top', type=int, default=20, help="number of ranked phrases compared")
+    parser.add_argument('--runs', type=int, default=3, help="timed runs per engine and input")
+    parser.add_argument('--check-only', action='store_true', help="only run the comparison with rake_nltk")
+    args = parser.parse_args()
+
+    corpus = "\n\n".join(main.load_text_file(path) or "" for path in args.corpus)
+    if not corpus.strip():
+        parser.error("the corpus files are empty")
+
+    failed = check(corpus, args.top) > 0
+    if args.check_only:
+        sys.exit(1 if failed else 0)
+
+    print(f"\n{'input':<8}{'chars':>12}{'engine':>11}{'latency s':>11}{'speedup':>9}{'matches':>9}")
+    for name, text in build_inputs(corpus, args.large_mb):
+        expected, baseline = timed(lambda: reference_tags(text, args.top), args.runs)
+        print(f"{name:<8}{len(text):>12}{'rake_nltk':>11}{baseline:>11.3f}{1.0:>9.2f}{'':>9}")
+        tags, latency = timed(lambda: streaming_tags(text, args.top), args.runs)
+        print(f"{'':<8}{'':>12}{'streaming':>11}{latency:>11.3f}{baseline / latency:>9.2f}{str(tags == expected):>9}")
+        failed = failed or tags != expected
+
+    sys.exit(1 if failed else 0)
@@ -1,12 +1,37 @@
 import os
 import time
+import threading
+import shutil
+import functools
+import contextlib
+import hashlib
+import sqlite3
+import collections
+import collections.abc
+import heapq
+import concurrent.futures
 import json
 import base64
 import pika
 from rake_nltk import Rake
 import nltk
 from dotenv import load_dotenv
-import chardet
+
+# Optional binary framing and compression support
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+import codecs
+from chardet import UniversalDetector
 
 print(" [x] Downloading nltk parts...")
 nltk.download('stopwords')
@@ -26,84 +51,374 @@ print(f" [+] RabbitMQ Host: {RABBITMQ_HOST}, User: {RABBITMQ_USER}, VHost: {RABB
 QUEUE_NAME = 'file_processing_queue'
 credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
 
+# Result publisher settings
+PUBLISH_MAX_RETRIES = int(os.getenv('PUBLISH_MAX_RETRIES', 5))
+PUBLISH_BACKOFF_BASE = float(os.getenv('PUBLISH_BACKOFF_BASE', 0.5))
+PUBLISH_BACKOFF_MAX = float(os.getenv('PUBLISH_BACKOFF_MAX', 30))
+# Heartbeat of the publisher connection, serviced by its keepalive thread between jobs
+PUBLISHER_HEARTBEAT = int(os.getenv('PUBLISHER_HEARTBEAT', 60))
+
+# Consumer concurrency settings, WORKER_COUNT=1 keeps jobs inline on the consumer thread
+WORKER_COUNT = int(os.getenv('WORKER_COUNT', 1))
+WORKER_POOL = os.getenv('WORKER_POOL', 'thread')  # 'thread' or 'process'
+PREFETCH_COUNT = int(os.getenv('PREFETCH_COUNT', WORKER_COUNT))
+
+# 'exclusive' gives each process a private queue, 'shared' makes every replica of
+# this module a competing consumer on one durable queue with acks sent after publishing
+QUEUE_MODE = os.getenv('QUEUE_MODE', 'exclusive')
+SHARED_QUEUE_NAME = os.getenv('SHARED_QUEUE_NAME', '')
+# Manually acked jobs that fail this many deliveries are rejected without requeueing
+# (dead-lettered when the queue has a DLX policy). Quorum queues count deliveries in
+# x-delivery-count, classic queues only flag redeliveries so a job is retried once there
+MAX_DELIVERY_ATTEMPTS = int(os.getenv('MAX_DELIVERY_ATTEMPTS', 3))
+
+# Claim-check transfers: a message may carry 'file_ref', a path relative to the shared
+# backend volume, instead of the whole file base64 encoded in 'filedata'
+SHARED_FS_ROOT = os.getenv('SHARED_FS_ROOT', '/app/backend/fs')
+
+# Message framing, requests are decoded according to their AMQP content_type and
+# content_encoding, results are published as RESULT_CONTENT_TYPE
+JSON_CONTENT_TYPE = 'application/json'
+MSGPACK_CONTENT_TYPES = ('application/msgpack', 'application/x-msgpack')
+RESULT_CONTENT_TYPE = os.getenv('RESULT_CONTENT_TYPE', JSON_CONTENT_TYPE)
+
+# Chunked transfers that receive no chunk for this many seconds are discarded
+CHUNK_TRANSFER_TIMEOUT = int(os.getenv('CHUNK_TRANSFER_TIMEOUT', 600))
+
+# Text encodings are detected from at most this many bytes at the start of a file
+ENCODING_DETECT_BYTES = int(os.getenv('ENCODING_DETECT_BYTES', 64 * 1024))
+
+# Results are cached by file content so re-uploaded files skip extraction, the
+# cache is shared by every worker using the same RESULT_CACHE_DIR
+RESULT_CACHE = os.getenv('RESULT_CACHE', 'true').lower() == 'true'
+RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR', 'cache')
+RESULT_CACHE_MAX_MB = float(os.getenv('RESULT_CACHE_MAX_MB', 64))
+# Bump to invalidate cached results after changing how tags are extracted
+RESULT_CACHE_VERSION = os.getenv('RESULT_CACHE_VERSION', '1')
+
+# Keyword extraction consumes text in windows of this many characters, only distinct
+# candidate phrases and their counts are kept between windows
+KEYWORD_WINDOW_CHARS = int(os.getenv('KEYWORD_WINDOW_CHARS', 64 * 1024))
+
+# Built once per process, holds the stopword set and tokenizers
+rake = Rake()
+
+class StreamingRake:
+    """RAKE over a stream of text windows.
+
+    Uses the shared Rake's tokenizers, stopwords and phrase splitting, but
+    instead of the whole document and its full phrase list it only keeps a
+    count per distinct candidate phrase. The last, possibly incomplete,
+    sentence of a window is carried over to the next one, so the ranking is
+    the same as Rake.get_ranked_phrases() on the concatenated text.
+    """
+
+    def __init__(self, rake, window_chars=KEYWORD_WINDOW_CHARS):
+        self._rake = rake
+        self._window_chars = window_chars
+        self._carry = ''
+        self.phrases = collections.Counter()
+
+    def feed(self, text):
+        text = self._carry + text
+        sentences = self._rake.sentence_tokenizer(text)
+        if len(sentences) > 1 or len(text) < 2 * self._window_chars:
+            # Hold back the last sentence, the next window may continue it
+            last = sentences.pop() if sentences else ''
+            self._carry = text[text.rfind(last):] if last else ''
+        else:
+            # A single sentence that keeps growing, process it up to its last whitespace
+            # to bound memory without splitting a word, and carry the rest
+            cut = max(text.rfind(c) for c in ' \t\r\n')
+            if cut <= 0:
+                cut = len(text)
+            sentences = [text[:cut]]
+            self._carry = text[cut:]
+        self._add_sentences(sentences)
+
+    def ranked_phrases(self, top_results):
+        """Top ranked phrases, repeated phrases appear once per occurrence like in rake_nltk"""
+        if self._carry:
+            self._add_sentences(self._rake.sentence_tokenizer(self._carry))
+            self._carry = ''
+        return self._rank(top_results)
+
+    def _rank(self, top_results):
+        # Word frequency and degree follow from the phrase counts: every occurrence
+        # of a word co-occurs with each word of its phrase, itself included
+        frequency = collections.Counter()
+        degree = collections.Counter()
+        for phrase, count in self.phrases.items():
+            for word in phrase:
+                frequency[word] += count
+                degree[word] += count * len(phrase)
+
+        scored = ((sum(degree[word] / frequency[word] for word in phrase), ' '.join(phrase), count)
+                  for phrase, count in self.phrases.items())
+        ranked = []
+        for _, phrase, count in heapq.nlargest(top_results, scored):
+            ranked.extend([phrase] * count)
+        return ranked[:top_results]
+
+    def _add_sentences(self, sentences):
+        for sentence in sentences:
+            words = [word.lower() for word in self._rake.word_tokenizer(sentence)]
+            self.phrases.update(self._rake._get_phrase_list_from_words(words))
+
+def iter_text_windows(text, size=KEYWORD_WINDOW_CHARS):
+    """Split a string into windows of `size` characters"""
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
 def extract_tags(content, top_results=5):
-    """Extract key phrases from text content using RAKE"""
-    r = Rake()
+    """Extract key phrases from text content using RAKE.
 
-    # Force convert content to string
-    if not isinstance(content, str):
-        content = str(content)
+    `content` is a string or an iterator of text windows, e.g. from iter_text_file().
+    """
+    if isinstance(content, collections.abc.Iterator):
+        windows = content
+    else:
+        # Force convert content to string
+        if not isinstance(content, str):
+            content = str(content)
 
-    # Check if content is None or empty
-    if not content or content.strip() == "" or content == "None":
-        return []
-    
-    r.extract_keywords_from_text(content)
-    ranked_tags = r.get_ranked_phrases()
-    return ranked_tags[:top_results]
+        # Check if content is None or empty
+        if not content or content.strip() == "" or content == "None":
+            return []
+        windows = iter_text_windows(content)
+
+    engine = StreamingRake(rake)
+    for window in windows:
+        engine.feed(window)
+    return engine.ranked_phrases(top_results)
+
+
+def detect_encoding(file_path, limit=ENCODING_DETECT_BYTES):
+    """Guess a file's encoding from at most `limit` bytes of its start"""
+    with open(file_path, 'rb') as f:
+        prefix = f.read(limit)
+
+    # UTF-32 BOMs begin with the UTF-16 ones, so they are checked first
+    for bom, encoding in ((codecs.BOM_UTF8, 'utf-8-sig'),
+                          (codecs.BOM_UTF32_LE, 'utf-32'), (codecs.BOM_UTF32_BE, 'utf-32'),
+                          (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16')):
+        if prefix.startswith(bom):
+            return encoding
 
+    # Fast path for UTF-8 (and ASCII), a character cut off at the end of the prefix is fine
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(prefix, final=len(prefix) < limit)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+
+    detector = UniversalDetector()
+    for start in range(0, len(prefix), 4096):
+        detector.feed(prefix[start:start + 4096])
+        if detector.done:
+            break
+    detector.close()
+    return detector.result['encoding'] or 'utf-8'
 
 def load_text_file(file_path):
     """Load and read text file content"""
     print(f" [+] Loading text file")
+    if os.path.getsize(file_path) == 0:
+        print(" [!] File is empty.")
+        return ""
+
+    encoding = detect_encoding(file_path)
+    print(f" [+] Detected encoding: {encoding}")
     with open(file_path, 'rb') as f:
         raw = f.read()
+    try:
+        return raw.decode(encoding)
+    except (UnicodeDecodeError, LookupError) as e:
+        # The prefix guess did not hold for the whole file, keep the text anyway
+        print(f"Error decoding file with detected encoding {encoding}: {str(e)}, replacing invalid bytes")
+        return raw.decode(encoding if isinstance(e, UnicodeDecodeError) else 'utf-8', errors='replace')
 
-        if not raw:
-            print(" [!] File is empty.")
-            return ""
-        
-        result = chardet.detect(raw)
-        encoding = result['encoding']
-        print(f" [+] Detected encoding: {encoding}")
-        try:
-            return raw.decode(encoding)
-        except Exception as e:
-            print(f"Error decoding file with detected encoding {encoding}: {str(e)}")
-            return None
+def iter_text_file(file_path, size=KEYWORD_WINDOW_CHARS):
+    """Stream a text file as decoded windows of `size` characters"""
+    encoding = detect_encoding(file_path)
+    print(f" [+] Streaming text file, detected encoding: {encoding}")
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        # chardet can name codecs Python does not have, e.g. 'x-euc-tw'
+        print(f" [!] Python has no codec for {encoding}, decoding as utf-8")
+        encoding = 'utf-8'
+    # newline='' keeps line endings as they are in the file
+    with open(file_path, encoding=encoding, errors='replace', newline='') as f:
+        for window in iter(lambda: f.read(size), ''):
+            yield window
 
 def dedupe_tags(tags):
     """Remove duplicate tags from the list"""
     return list(set(tags))
 
-def send_message_to_queue(queue_name, message):
-    """Send message to RabbitMQ queue"""
-    try:
-        connection = pika.BlockingConnection(pika.ConnectionParameters(
+class ResultPublisher:
+    """Long-lived RabbitMQ publisher shared by every job in this process.
+
+    Keeps one connection and channel open, declares each target queue only
+    once and reconnects with exponential backoff when the broker goes away.
+    The channel uses publisher confirms, so a publish only succeeds once the
+    broker has taken the message. Publishing is serialized with a lock so
+    worker threads can share it, and a keepalive thread services heartbeats
+    under the same lock so the connection survives idle gaps between jobs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connection = None
+        self._channel = None
+        self._declared_queues = set()
+        self._keepalive_thread = None
+
+    def _connect(self):
+        self._connection = pika.BlockingConnection(pika.ConnectionParameters(
             host=RABBITMQ_HOST,
             credentials=credentials,
             virtual_host=RABBITMQ_VHOST,
-            port=RABBITMQ_PORT
+            port=RABBITMQ_PORT,
+            heartbeat=PUBLISHER_HEARTBEAT,
+            blocked_connection_timeout=300
         ))
-        channel = connection.channel()
+        self._channel = self._connection.channel()
+        self._channel.confirm_delivery()
+        self._declared_queues = set()
+        print(" [*] Publisher connection opened")
 
-        channel.queue_declare(queue=queue_name, durable=True)
-        message_json = json.dumps(message)
+        # Heartbeats are disabled with 0, there is nothing to keep alive then.
+        # Not alive in a forked worker process, the thread is started again there
+        if PUBLISHER_HEARTBEAT > 0 and (self._keepalive_thread is None or not self._keepalive_thread.is_alive()):
+            self._keepalive_thread = threading.Thread(target=self._keepalive, name='publisher-keepalive', daemon=True)
+            self._keepalive_thread.start()
 
-        channel.basic_publish(
-            exchange='',
-            routing_key=queue_name,
-            body=message_json,
-            properties=pika.BasicProperties(delivery_mode=2)
-        )
-        print(f" [*] Message sent to queue '{queue_name}'")
+    def _keepalive(self):
+        while True:
+            time.sleep(PUBLISHER_HEARTBEAT / 3)
+            with self._lock:
+                if self._connection is None or not self._connection.is_open:
+                    continue
+                try:
+                    self._connection.process_data_events(time_limit=0)
+                except pika.exceptions.AMQPError as e:
+                    print(f" [!] Publisher connection lost while idle: {e!r}")
+                    self._reset()
+
+    def _ensure_channel(self):
+        if (self._connection is None or self._connection.is_closed
+                or self._channel is None or self._channel.is_closed):
+            self._reset()
+            self._connect()
+
+    def _reset(self):
+        try:
+            if self._connection is not None and self._connection.is_open:
+                self._connection.close()
+        except Exception:
+            pass
+        self._connection = None
+        self._channel = None
+        self._declared_queues = set()
+
+    def publish(self, queue_name, body, properties=None):
+        """Publish body to a durable queue, returns True once the broker confirmed it"""
+        if properties is None:
+            properties = pika.BasicProperties(delivery_mode=2)
+
+        with self._lock:
+            for attempt in range(PUBLISH_MAX_RETRIES + 1):
+                if attempt > 1:
+                    # The first retry is immediate, a stale idle connection is the usual cause
+                    delay = min(PUBLISH_BACKOFF_MAX, PUBLISH_BACKOFF_BASE * (2 ** (attempt - 2)))
+                    print(f" [!] Retrying publish in {delay:.1f} seconds...")
+                    time.sleep(delay)
+                try:
+                    self._ensure_channel()
+                    if queue_name not in self._declared_queues:
+                        self._channel.queue_declare(queue=queue_name, durable=True)
+                        self._declared_queues.add(queue_name)
+
+                    # Blocks until the broker acks, raises NackError/UnroutableError otherwise
+                    self._channel.basic_publish(
+                        exchange='',
+                        routing_key=queue_name,
+                        body=body,
+                        properties=properties,
+                        mandatory=True
+                    )
+                    return True
+                except pika.exceptions.AMQPError as e:
+                    print(f" [!] Publish attempt {attempt + 1} failed: {e!r}")
+                    self._reset()
+
+            print(f" [!] Giving up on publishing to '{queue_name}' after {PUBLISH_MAX_RETRIES + 1} attempts")
+            return False
+
+    def close(self):
+        with self._lock:
+            self._reset()
+            print(" [*] Publisher connection closed")
+
+
+publisher = ResultPublisher()
+
+def supported_framing():
+    """Content types and encodings this process can decode, sent on registration"""
+    content_types = [JSON_CONTENT_TYPE]
+    if msgpack is not None:
+        content_types += list(MSGPACK_CONTENT_TYPES)
+    content_encodings = ['identity']
+    if zstandard is not None:
+        content_encodings.append('zstd')
+    if lz4 is not None:
+        content_encodings.append('lz4')
+    return content_types, content_encodings
+
+def decode_message(body, content_type=None, content_encoding=None):
+    """Decode a message body from JSON or msgpack, decompressing it first if needed"""
+    if content_encoding == 'zstd' and zstandard is not None:
+        # Streaming decompressor, the frame header may not carry the content size
+        body = zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    elif content_encoding == 'lz4' and lz4 is not None:
+        body = lz4.frame.decompress(body)
+    elif content_encoding not in (None, '', 'identity'):
+        raise ValueError(f"unsupported content encoding: {content_encoding}")
+
+    if content_type in MSGPACK_CONTENT_TYPES:
+        if msgpack is None:
+            raise ValueError("msgpack message received but msgpack is not installed")
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body)
+
+def encode_message(message):
+    """Encode an outgoing message as RESULT_CONTENT_TYPE, returns body and properties"""
+    if RESULT_CONTENT_TYPE in MSGPACK_CONTENT_TYPES and msgpack is not None:
+        body = msgpack.packb(message, use_bin_type=True)
+        content_type = RESULT_CONTENT_TYPE
+    else:
+        body = json.dumps(message)
+        content_type = JSON_CONTENT_TYPE
+    return body, pika.BasicProperties(delivery_mode=2, content_type=content_type)
+
+def send_message_to_queue(queue_name, message):
+    """Send message to RabbitMQ queue"""
+    try:
+        message_body, properties = encode_message(message)
+        if publisher.publish(queue_name, message_body, properties):
+            print(f" [*] Message sent to queue '{queue_name}'")
+            return True
     except Exception as e:
         print(f"Failed to publish message: {str(e)}")
-    finally:
-        if 'connection' in locals() and connection.is_open:
-            connection.close()
-            print(" [*] Connection closed after sending the message.")
+    return False
 
 def process_text_file(file_path):
     """Process text file and extract metadata"""
     try:
-        # Load text content
-        content = load_text_file(file_path)
-        if not content:
-            return None
-
-        # Extract tags from content
-        tags = extract_tags(content)
+        # Extract tags while streaming the content, the file is never fully loaded
+        tags = extract_tags(iter_text_file(file_path))
 
         return tags
     except Exception as e:
@@ -112,44 +427,185 @@ def process_text_file(file_path):
     
 
 
+def link_shared_file(file_ref, local_file_path):
+    """Expose a file from the shared volume at local_file_path without copying it"""
+    root = os.path.realpath(SHARED_FS_ROOT)
+    shared_path = os.path.realpath(os.path.join(root, file_ref))
+
+    # Refuse references that escape the shared volume
+    if os.path.commonpath([root, shared_path]) != root:
+        raise ValueError(f"file reference outside of {SHARED_FS_ROOT}: {file_ref}")
+    if not os.path.isfile(shared_path):
+        raise FileNotFoundError(f"shared file not found: {shared_path}")
+
+    if os.path.lexists(local_file_path):
+        os.remove(local_file_path)
+    try:
+        os.symlink(shared_path, local_file_path)
+    except OSError:
+        # Symlinks not permitted here (e.g. Windows without privileges), fall back to a copy
+        shutil.copyfile(shared_path, local_file_path)
+
 def callback(ch, method, properties, body):
-    """Callback function for RabbitMQ messages"""
+    """Callback function for RabbitMQ messages, runs jobs inline with auto-ack (exclusive mode)"""
+    if is_transfer_message(properties):
+        completed = receive_transfer_message(properties, body)
+        done = process_request(*completed) if completed else True
+    else:
+        done = process_message(body, properties.content_type, properties.content_encoding)
+    if not done:
+        # The delivery was auto-acked on arrival, so the broker has nothing to requeue
+        print(" [-] Message was auto-acked, the job is dropped instead of requeued")
+
+def process_message(body, content_type=None, content_encoding=None):
+    """Decode an extraction request message and process it"""
+    try:
+        data = decode_message(body, content_type, content_encoding)
+    except Exception as e:
+        print(f" [-] Error decoding message: {str(e)}")
+        return True
+    return process_request(data)
+
+def file_sha256(file_path):
+    """SHA-256 of a file's content, read in blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ResultCache:
+    """Extracted tags cached by file content in a local SQLite database.
+
+    Keys are the SHA-256 of the file plus a version string naming the module,
+    its models and the request options that shape the tags, so a change to any
+    of them misses. Every call opens its own connection and each read or write
+    is a single transaction, so worker threads and processes can share the
+    database. Once the stored tags exceed max_bytes the least recently used
+    entries are evicted. Hit and miss counters live in the database as well.
+    """
+
+    def __init__(self, directory, max_bytes, version):
+        self._directory = directory
+        self._path = os.path.join(directory, 'results.db')
+        self._max_bytes = max_bytes
+        self._version = version
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        with self._lock:
+            if not self._initialized:
+                os.makedirs(self._directory, exist_ok=True)
+                with contextlib.closing(sqlite3.connect(self._path, timeout=30)) as db, db:
+                    db.execute("PRAGMA journal_mode=WAL")
+                    db.execute("""CREATE TABLE IF NOT EXISTS results (
+                        cache_key TEXT PRIMARY KEY,
+                        tags TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        last_used REAL NOT NULL)""")
+                    db.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+                    db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+                    db.execute("INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0)")
+                self._initialized = True
+        return contextlib.closing(sqlite3.connect(self._path, timeout=30))
+
+    def key(self, digest, *options):
+        """Cache key of a file from its content hash, the cache version and request options"""
+        return ":".join([digest, self._version, *options])
+
+    def get(self, cache_key):
+        """Cached tags for a key or None, counts the lookup as a hit or a miss"""
+        with self._connect() as db, db:
+            row = db.execute("SELECT tags FROM results WHERE cache_key = ?", (cache_key,)).fetchone()
+            if row:
+                db.execute("UPDATE results SET last_used = ? WHERE cache_key = ?", (time.time(), cache_key))
+            db.execute("UPDATE counters SET value = value + 1 WHERE name = ?", ('hits' if row else 'misses',))
+            counters = dict(db.execute("SELECT name, value FROM counters"))
+        print(f" [+] Result cache {'hit' if row else 'miss'} ({counters['hits']} hits, {counters['misses']} misses)")
+        return json.loads(row[0]) if row else None
+
+    def put(self, cache_key, tags):
+        encoded = json.dumps(tags)
+        with self._connect() as db, db:
+            db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                       (cache_key, encoded, len(encoded), time.time()))
+            # Keep the most recently used entries that fit in max_bytes
+            db.execute("""DELETE FROM results WHERE cache_key IN (
+                SELECT cache_key FROM (
+                    SELECT cache_key, SUM(size) OVER (ORDER BY last_used DESC, cache_key) AS total
+                    FROM results)
+                WHERE total > ?)""", (self._max_bytes,))
+
+    def stats(self):
+        """Hit and miss counters, entry count and stored bytes"""
+        with self._connect() as db:
+            stats = dict(db.execute("SELECT name, value FROM counters"))
+            stats['entries'], stats['bytes'] = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return stats
+
+
+# Cache key version, covers the module and the models and settings that produce its tags
+result_cache = ResultCache(RESULT_CACHE_DIR, int(RESULT_CACHE_MAX_MB * 1024 * 1024),
+                           f"text_meta_extractor:{RESULT_CACHE_VERSION}") if RESULT_CACHE else None
+
+def process_request(data, local_file_path=None):
+    """Process a single extraction request and publish its tags.
+
+    local_file_path is set when the file was already staged, e.g. by a chunked
+    transfer. Returns False when the result could not be published and the
+    message should be redelivered, True once it is done with (including bad input).
+    """
     try:
-        data = json.loads(body)
-        file_path = data.get('filename')
+        file_ref = data.get('file_ref')  # path on the shared volume, preferred over filedata
+        file_path = data.get('filename') or file_ref
         file_name = os.path.basename(file_path)
-        file_data = data.get('filedata')  # base64 encoded
+        file_data = data.get('filedata')  # base64 encoded, or raw bytes in msgpack
         status_id = data.get('status_id')
         
-        if not all([file_name, file_data, status_id]):
+        if not all([file_name, local_file_path or file_ref or file_data, status_id]):
             print(" [-] Invalid message format")
-            return
+            return True
             
-        # Create uploads directory if it doesn't exist
-        if not os.path.exists('uploads'):
-            os.makedirs('uploads')
+        if local_file_path is None:
+            # Create uploads directory if it doesn't exist
+            if not os.path.exists('uploads'):
+                os.makedirs('uploads')
             
-        # Save the file to our uploads directory
-        local_file_path = os.path.join('uploads', file_name)
-        try:
-            decoded_data = base64.b64decode(file_data)
-            with open(local_file_path, 'wb') as f:
-                f.write(decoded_data)
-            print(f" [+] Saved file to: {local_file_path}")
-        except Exception as e:
-            print(f" [!] Failed to save file: {str(e)}")
-            return
+            # Save the file to our uploads directory
+            local_file_path = os.path.join('uploads', f"{status_id}_{file_name}")
+            try:
+                if file_ref:
+                    link_shared_file(file_ref, local_file_path)
+                    print(f" [+] Linked shared file {file_ref} to: {local_file_path}")
+                else:
+                    if isinstance(file_data, bytes):
+                        decoded_data = file_data
+                    else:
+                        decoded_data = base64.b64decode(file_data)
+                    with open(local_file_path, 'wb') as f:
+                        f.write(decoded_data)
+                    print(f" [+] Saved file to: {local_file_path}")
+            except Exception as e:
+                print(f" [!] Failed to save file: {str(e)}")
+                return True
             
         # Process the text file
         ##########################EDITME##################################
         ##### CHANGE THIS FUNCTION TO EXTRACT METADATA FROM THE FILE #####
         ##################################################################
-        tags = process_text_file(local_file_path)
-        tags = dedupe_tags(tags)
+        cache_key = result_cache.key(file_sha256(local_file_path)) if result_cache else None
+        tags = result_cache.get(cache_key) if result_cache else None
+        if tags is None:
+            tags = process_text_file(local_file_path)
+            tags = dedupe_tags(tags)
+            if result_cache and tags:
+                result_cache.put(cache_key, tags)
         
+        published = True
         if tags:
             # Send results back through RabbitMQ
-            send_message_to_queue("meta_tags_results", {
+            published = send_message_to_queue("meta_tags_results", {
                 'tags': tags,
                 'processed_resource_id': int(status_id)
             })
@@ -161,13 +617,252 @@ def callback(ch, method, properties, body):
         except Exception as e:
             print(f" [-] Error cleaning up processed file: {str(e)}")
         
+        if not published:
+            print(f" [-] Could not publish tags for resource ID: {status_id}")
+            return False
+
         print(f" [+] Successfully processed file and sent tags for resource ID: {status_id}")
+        return True
         
     except Exception as e:
         print(f" [-] Error processing message: {str(e)}")
+        return True
+
+class ChunkedTransfers:
+    """Reassembles large files sent as a header message plus sequenced chunks.
+
+    Transfer messages are marked with an 'x-transfer' AMQP header:
+      header: {'status_id', 'filename', 'total_chunks', 'chunk_size', ...request fields}
+      chunk:  {'status_id', 'index', 'data'}
+    Every chunk but the last holds exactly chunk_size bytes and is written at
+    its offset in the file in uploads/ as it arrives, so neither the file nor
+    out-of-order chunks are held in memory. Transfer state lives in this
+    process and the exclusive queue goes away with it, so a crashed consumer
+    loses its transfers and senders retry them. Chunked transfers are rejected
+    when QUEUE_MODE is 'shared', as chunks would spread across replicas; use
+    claim-check references there. Only used from the consumer thread.
+    """
+
+    def __init__(self):
+        self._transfers = {}
+
+    def start(self, header):
+        status_id = str(header['status_id'])
+        file_name = os.path.basename(header['filename'])
+        self._discard(status_id)
+
+        if not os.path.exists('uploads'):
+            os.makedirs('uploads')
+        path = os.path.join('uploads', f"{status_id}_{file_name}")
+
+        self._transfers[status_id] = {
+            'header': header,
+            'path': path,
+            'file': open(path, 'wb'),
+            'total_chunks': int(header['total_chunks']),
+            'chunk_size': int(header['chunk_size']),
+            'received': set(),
+            'updated': time.monotonic()
+        }
+        print(f" [+] Started chunked transfer for resource ID: {status_id} ({header['total_chunks']} chunks)")
+
+    def add_chunk(self, chunk):
+        """Write a chunk, returns the header and file path once the last chunk landed"""
+        status_id = str(chunk['status_id'])
+        transfer = self._transfers.get(status_id)
+        if transfer is None:
+            print(f" [-] Chunk for unknown transfer {status_id}, ignoring")
+            return None
+
+        index = int(chunk['index'])
+        if not 0 <= index < transfer['total_chunks']:
+            print(f" [-] Chunk {index} out of range for transfer {status_id}, ignoring")
+            return None
+        if index in transfer['received']:
+            print(f" [-] Duplicate chunk {index} for transfer {status_id}, ignoring")
+            return None
+
+        data = chunk['data']
+        transfer['file'].seek(index * transfer['chunk_size'])
+        transfer['file'].write(data if isinstance(data, bytes) else base64.b64decode(data))
+        transfer['received'].add(index)
+        transfer['updated'] = time.monotonic()
+
+        if len(transfer['received']) < transfer['total_chunks']:
+            return None
+
+        transfer['file'].close()
+        del self._transfers[status_id]
+        print(f" [+] Completed chunked transfer for resource ID: {status_id}")
+        return transfer['header'], transfer['path']
+
+    def collect_garbage(self):
+        """Drop transfers that have not received a chunk within CHUNK_TRANSFER_TIMEOUT"""
+        now = time.monotonic()
+        for status_id, transfer in list(self._transfers.items()):
+            if now - transfer['updated'] > CHUNK_TRANSFER_TIMEOUT:
+                print(f" [-] Chunked transfer {status_id} timed out after "
+                      f"{len(transfer['received'])}/{transfer['total_chunks']} chunks, discarding")
+                self._discard(status_id)
+
+    def _discard(self, status_id):
+        transfer = self._transfers.pop(status_id, None)
+        if transfer is None:
+            return
+        transfer['file'].close()
+        try:
+            os.remove(transfer['path'])
+        except OSError:
+            pass
+
+
+transfers = ChunkedTransfers()
+
+def is_transfer_message(properties):
+    return bool((properties.headers or {}).get('x-transfer'))
+
+def receive_transfer_message(properties, body):
+    """Handle a chunked transfer message, returns (request, file path) once complete"""
+    try:
+        data = decode_message(body, properties.content_type, properties.content_encoding)
+        kind = properties.headers.get('x-transfer')
+        if QUEUE_MODE == 'shared':
+            # Chunks of one transfer would be spread over every replica of the shared queue
+            print(f" [-] Chunked transfers are not supported with QUEUE_MODE=shared, "
+                  f"dropping {kind} for resource ID: {data.get('status_id')}")
+        elif kind == 'header':
+            transfers.collect_garbage()
+            transfers.start(data)
+        elif kind == 'chunk':
+            return transfers.add_chunk(data)
+        else:
+            print(f" [-] Unknown transfer message type: {kind}")
+    except Exception as e:
+        print(f" [-] Error handling transfer message: {str(e)}")
+    return None
+
+def schedule_transfer_gc(connection):
+    """Periodically discard stalled chunked transfers on the consumer thread"""
+    interval = min(60, CHUNK_TRANSFER_TIMEOUT)
+
+    def run():
+        transfers.collect_garbage()
+        if connection.is_open:
+            connection.call_later(interval, run)
+
+    connection.call_later(interval, run)
+
+def create_worker_pool():
+    """Create the executor jobs are handed to, or None to run them inline"""
+    if WORKER_COUNT <= 1:
+        if QUEUE_MODE != 'shared':
+            return None
+        # Shared mode acks after the job, which must not block the I/O thread and its heartbeats
+        print(" [+] Using a single worker thread for shared queue mode")
+        return concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    print(f" [+] Using {WORKER_POOL} pool with {WORKER_COUNT} workers, prefetch {PREFETCH_COUNT}")
+    if WORKER_POOL == 'process':
+        return concurrent.futures.ProcessPoolExecutor(max_workers=WORKER_COUNT)
+    return concurrent.futures.ThreadPoolExecutor(max_workers=WORKER_COUNT)
+
+def settle_message(ch, delivery_tag, done, requeue=True):
+    """Ack a finished delivery, requeue or reject it, must run on the connection's own thread"""
+    if not ch.is_open:
+        print(" [-] Channel closed before ack, message will be redelivered")
+    elif done:
+        ch.basic_ack(delivery_tag)
+    elif requeue:
+        print(" [-] Requeueing message")
+        ch.basic_nack(delivery_tag, requeue=True)
+    else:
+        ch.basic_nack(delivery_tag, requeue=False)
+
+def is_last_attempt(method, properties):
+    """True when a failed delivery must not be requeued again (see MAX_DELIVERY_ATTEMPTS)"""
+    headers = properties.headers or {}
+    earlier = headers.get('x-delivery-count')
+    if earlier is None and headers.get('x-death'):
+        # Retried through a dead letter exchange, every pass is counted there
+        earlier = sum(death.get('count', 0) for death in headers['x-death'])
+    if earlier is not None:
+        return int(earlier) + 1 >= MAX_DELIVERY_ATTEMPTS
+    return MAX_DELIVERY_ATTEMPTS <= 1 or method.redelivered
+
+def message_resource_id(properties, body):
+    """The status_id of a request message for logging, None when it can't be decoded"""
+    try:
+        return decode_message(body, properties.content_type, properties.content_encoding).get('status_id')
+    except Exception:
+        return None
+
+class WorkerPool:
+    """The executor jobs are handed to, replaced when one of its processes dies.
+
+    A worker process killed mid-job (OOM, a crash in native code) leaves a
+    ProcessPoolExecutor broken for good, so submitting to a broken pool builds
+    a new one. Only used from the consumer thread.
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+
+    def submit(self, fn, *args):
+        """Submit a job, returns None when the pool was broken and had to be rebuilt"""
+        try:
+            return self.executor.submit(fn, *args)
+        except concurrent.futures.BrokenExecutor:
+            print(" [!] A worker process died, rebuilding the worker pool")
+            self.executor.shutdown(wait=False)
+            self.executor = create_worker_pool()
+            return None
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+def dispatch_message(ch, method, properties, body, connection, pool):
+    """Hand a delivery to the worker pool and ack it from the I/O thread once done"""
+    delivery_tag = method.delivery_tag
+    completed = None
+
+    def on_done(future):
+        if future.exception():
+            print(f" [-] Worker failed: {future.exception()}")
+            done = False
+        else:
+            done = future.result()
+        requeue = True
+        if not done and is_last_attempt(method, properties):
+            requeue = False
+            resource_id = completed[0].get('status_id') if completed else message_resource_id(properties, body)
+            print(f" [!] Giving up on resource ID: {resource_id} after its last delivery attempt, rejecting the message")
+        try:
+            connection.add_callback_threadsafe(functools.partial(settle_message, ch, delivery_tag, done, requeue))
+        except Exception as e:
+            print(f" [-] Could not schedule ack, message will be redelivered: {str(e)}")
+
+    if is_transfer_message(properties):
+        # Chunks are written on this thread so they stay in this process
+        completed = receive_transfer_message(properties, body)
+        if completed is None:
+            settle_message(ch, delivery_tag, True)
+            return
+        future = pool.submit(process_request, *completed)
+    else:
+        future = pool.submit(
+            process_message, body, properties.content_type, properties.content_encoding
+        )
+    if future is None:
+        # Requeued, the redelivery goes to the rebuilt pool
+        settle_message(ch, delivery_tag, False)
+        return
+    future.add_done_callback(on_done)
 
 def start_rabbitmq_consumer():
     """Start RabbitMQ consumer for text processing"""
+    executor = create_worker_pool()
+    pool = WorkerPool(executor) if executor is not None else None
+
     while True:  # Main reconnection loop
         try:
             connection = pika.BlockingConnection(
@@ -190,8 +885,13 @@ def start_rabbitmq_consumer():
             )
             
             # Create a queue for this module
-            result = channel.queue_declare(queue='', exclusive=True)
-            queue_name = result.method.queue
+            if QUEUE_MODE == 'shared':
+                # One durable queue for all replicas, unacked jobs survive a crashed worker
+                queue_name = SHARED_QUEUE_NAME or f'extract.{MODULE_ID}'
+                channel.queue_declare(queue=queue_name, durable=True)
+            else:
+                result = channel.queue_declare(queue='', exclusive=True)
+                queue_name = result.method.queue
             
             # Bind to the appropriate routing key
             channel.queue_bind(
@@ -200,15 +900,29 @@ def start_rabbitmq_consumer():
                 routing_key=f'extract.{MODULE_ID}'
             )
             
-            # Set QoS to handle messages one at a time
-            channel.basic_qos(prefetch_count=1)
-            
-            channel.basic_consume(
-                queue=queue_name,
-                on_message_callback=callback,
-                auto_ack=True
-            )
+            if pool is None:
+                # Set QoS to handle messages one at a time
+                channel.basic_qos(prefetch_count=1)
+
+                channel.basic_consume(
+                    queue=queue_name,
+                    on_message_callback=callback,
+                    auto_ack=True
+                )
+            else:
+                # Keep up to PREFETCH_COUNT deliveries in flight, acked once their worker finishes
+                channel.basic_qos(prefetch_count=PREFETCH_COUNT)
+
+                channel.basic_consume(
+                    queue=queue_name,
+                    on_message_callback=functools.partial(
+                        dispatch_message, connection=connection, pool=pool
+                    ),
+                    auto_ack=False
+                )
             
+            schedule_transfer_gc(connection)
+
             print(f" [*] Waiting for text extraction requests...")
             
             try:
@@ -216,6 +930,9 @@ def start_rabbitmq_consumer():
             except KeyboardInterrupt:
                 channel.stop_consuming()
                 connection.close()
+                publisher.close()
+                if pool is not None:
+                    pool.shutdown()
                 break
             except pika.exceptions.ConnectionClosedByBroker:
                 print(" [-] Connection was closed by broker, retrying...")
@@ -249,7 +966,10 @@ def register_module(module_id):
             return
             
         if not availability['is_available']:
-            if availability['suggested_id']:
+            if QUEUE_MODE == 'shared':
+                # Another replica registered this ID already, join it on the shared queue
+                print(f" [+] Module ID {module_id} already registered, joining as a shared replica")
+            elif availability['suggested_id']:
                 print(f" [+] Using suggested module ID: {availability['suggested_id']}")
                 module_id = availability['suggested_id']
             else:
@@ -275,12 +995,15 @@ def register_module(module_id):
         )
         
         # Register this module with its supported extensions
+        content_types, content_encodings = supported_framing()
         registration_message = {
             'module_id': module_id,
-            'supported_extensions': ['.txt']  # Text extractor only supports .txt files
+            'supported_extensions': ['.txt'],  # Text extractor only supports .txt files
                 #####################EDITME#############################
                 ##### EDIT THIS BASED ON SUPPORTED FILE EXTENSIONS #####
                 ########################################################
+            'content_types': content_types,
+            'content_encodings': content_encodings
         }
         
         channel.basic_publish(